@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs the benches one after another with telemetry and compares every test with the previous runs
+# of the same simulator, slowdowns beyond the threshold are listed and make the script fail
+
+import os
+import sys
+import json
+import time
+import argparse
+import pathlib
+import statistics
+import subprocess
+
+from regression import DESIGN_DIR, find_benches, run_make, merge_telemetry
+
+HISTORY_FILE = DESIGN_DIR.parent / ".benchmark_history.json"
+
+# Metrics compared with the history, a larger value is worse unless marked
+METRICS = [("wall_time_s", "time", False), ("sim_ns_per_s", "speed", True), ("wakeups", "wakeups", False),
+           ("peak_rss_mb", "memory", False)]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DESIGN_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def run_benches(benches, output_dir, make_args, seed):
+    # One bench at a time, parallel simulators would slow each other down
+    telemetry_files = []
+
+    for bench in benches:
+        bench_dir = output_dir / bench["name"]
+        bench_dir.mkdir(parents=True, exist_ok=True)
+        telemetry_file = bench_dir / "telemetry.json"
+
+        if telemetry_file.exists():
+            telemetry_file.unlink()
+
+        env = dict(os.environ, RANDOM_SEED=str(seed), TELEMETRY="1", TELEMETRY_FILE=str(telemetry_file.resolve()))
+        env.pop("TESTCASE", None)
+
+        (returncode, wall_time) = run_make(bench, bench_dir / "sim_build", bench_dir / "results.xml",
+                                           bench_dir / "log.txt", make_args, env)
+        print("{:<20} {:>8.1f} s{}".format(bench["name"], wall_time,
+                                           "" if returncode == 0 else ", failed, see {}".format(bench_dir / "log.txt")))
+
+        telemetry_files.append(telemetry_file)
+
+    return telemetry_files
+
+def baseline(history, run, window):
+    # Median of every metric of each test over the last runs with the same simulator
+    runs = [previous for previous in history if previous.get("simulator") == run["simulator"]][-window:]
+    values = {}
+
+    for previous in runs:
+        for test in previous["tests"]:
+            if test["status"] == "passed":
+                values.setdefault((test["bench"], test["name"]), []).append(test)
+
+    return {key : {metric : statistics.median(test[metric] for test in tests) for (metric, _, _) in METRICS}
+            for (key, tests) in values.items()}, len(runs)
+
+def compare(run, reference, threshold, min_time):
+    slowdowns = 0
+
+    print("{:<20} {:<24} {:>10} {:>12} {:>10} {:>10}  {}".format("bench", "test", "time/s", "sim ns/s", "wakeups",
+                                                                  "rss/MB", "change"))
+
+    for test in run["tests"]:
+        key = (test["bench"], test["name"])
+        changes = []
+
+        if test["status"] != "passed":
+            changes.append(test["status"])
+        elif key not in reference:
+            changes.append("new")
+        else:
+            for (metric, label, higher_is_better) in METRICS:
+                (value, previous) = (test[metric], reference[key][metric])
+                if previous <= 0 or value <= 0:
+                    continue
+
+                ratio = previous / value if higher_is_better else value / previous
+
+                # Short tests are dominated by noise
+                if ratio > 1 + threshold and (metric == "wakeups" or max(test["wall_time_s"], reference[key]["wall_time_s"]) > min_time):
+                    changes.append("{} {:.2f}x worse".format(label, ratio))
+
+            slowdowns += 1 if changes else 0
+
+        print("{:<20} {:<24} {:>10.3f} {:>12.0f} {:>10} {:>10.1f}  {}".format(test["bench"], test["name"], test["wall_time_s"],
+              test["sim_ns_per_s"], test["wakeups"], test["peak_rss_mb"], ", ".join(changes)))
+
+    return slowdowns
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cocotb benches and compare each test with the stored history.')
+    parser.add_argument('-b', '--benches', type=str, nargs='+', help='only run these benches, e.g. wfg_stim_sine')
+    parser.add_argument('-x', '--exclude', type=str, nargs='+', default=[], help='benches to skip')
+    parser.add_argument('-o', '--output_dir', type=str, default='regression_build/benchmark', help='directory of the builds, logs and telemetry')
+    parser.add_argument('-t', '--telemetry', type=pathlib.Path, help='compare this telemetry of a regression run instead of running the benches')
+    parser.add_argument('--history', type=pathlib.Path, default=HISTORY_FILE, help='stored runs, the new run is appended')
+    parser.add_argument('-w', '--window', type=int, default=5, help='number of previous runs the median is taken over')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as regression')
+    parser.add_argument('--min_time', type=float, default=0.1, help='seconds below which time and speed changes are not reported')
+    parser.add_argument('--no_save', action='store_true', help='do not append this run to the history')
+    parser.add_argument('--seed', type=int, default=1, help='RANDOM_SEED of all simulations, fixed so runs are comparable')
+    parser.add_argument('make_args', type=str, nargs='*', help='variables passed to make, e.g. SIM=verilator')
+
+    args = parser.parse_args()
+
+    if args.telemetry is not None:
+        if not args.telemetry.exists():
+            print("Error: {} not found".format(args.telemetry))
+            sys.exit(1)
+
+        with open(args.telemetry, "r") as f:
+            run = json.load(f)
+    else:
+        benches = find_benches(args.benches, args.exclude)
+        if not benches:
+            print("Error: No benches found")
+            sys.exit(1)
+
+        output_dir = pathlib.Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        start = time.time()
+        telemetry_files = run_benches(benches, output_dir, args.make_args, args.seed)
+        run = merge_telemetry(telemetry_files, output_dir / "telemetry.json", start=start, seed=args.seed,
+                              make_args=args.make_args)
+
+    if not run["tests"]:
+        print("Error: No telemetry recorded, see the logs in {}".format(args.output_dir))
+        sys.exit(1)
+
+    run["commit"] = git_commit()
+
+    history = []
+    if args.history.exists():
+        with open(args.history, "r") as f:
+            history = json.load(f)
+
+    (reference, num_runs) = baseline(history, run, args.window)
+    print("Comparing {} tests with the median of {} previous runs".format(len(run["tests"]), num_runs))
+    slowdowns = compare(run, reference, args.threshold, args.min_time)
+
+    if not args.no_save:
+        history.append(run)
+        with open(args.history, "w") as f:
+            json.dump(history, f, indent=4)
+        print("Run {} added to {}".format(len(history), args.history))
+
+    if slowdowns:
+        print("{} tests got more than {:.0%} worse".format(slowdowns, args.threshold))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import shutil
+import random
+import argparse
+import pathlib
+import xml.etree.ElementTree as ET
+
+from regression import find_benches, run_make
+
+# Compiler of each simulator, to skip simulators which are not installed
+COMMANDS = {"icarus" : "iverilog", "verilator" : "verilator", "questa" : "vlog", "xcelium" : "xrun", "vcs" : "vcs"}
+
+def read_results(results_file):
+    if not results_file.exists():
+        return None
+
+    testcases = list(ET.parse(results_file).getroot().iter("testcase"))
+    return {"tests" : len(testcases),
+            "failures" : sum(1 for testcase in testcases
+                             if testcase.find("failure") is not None or testcase.find("error") is not None),
+            "sim_time_ns" : sum(float(testcase.get("sim_time_ns", 0)) for testcase in testcases),
+            "test_time" : sum(float(testcase.get("time", 0)) for testcase in testcases)}
+
+def run_simulator(bench, simulator, output_dir, make_args, seed):
+    sim_dir = output_dir / bench["name"] / simulator
+    build_dir = sim_dir / "sim_build"
+
+    # Start from an empty build, the first run includes the compilation
+    shutil.rmtree(build_dir, ignore_errors=True)
+    sim_dir.mkdir(parents=True, exist_ok=True)
+
+    env = dict(os.environ, RANDOM_SEED=str(seed))
+    env.pop("TESTCASE", None)
+
+    # The model cache would hide the build time
+    args = ["SIM={}".format(simulator), "MODEL_CACHE="] + make_args
+
+    result = {"bench" : bench["name"], "simulator" : simulator}
+
+    for run in ["cold", "warm"]:
+        results_file = sim_dir / "results_{}.xml".format(run)
+        if results_file.exists():
+            results_file.unlink()
+
+        (returncode, wall_time) = run_make(bench, build_dir, results_file, sim_dir / "log_{}.txt".format(run), args, env)
+        results = read_results(results_file)
+
+        if results is None:
+            print("Error: {} failed with {}, see {}".format(bench["name"], simulator, sim_dir / "log_{}.txt".format(run)))
+            return None
+
+        result[run] = dict(results, wall_time=wall_time)
+
+    return result
+
+def format_time(result, run):
+    return "{:.1f}".format(result[run]["wall_time"]) if result is not None else "n/a"
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the runtime of the block benches under different simulators.')
+    parser.add_argument('-b', '--benches', type=str, nargs='+', help='only run these benches, e.g. wfg_stim_sine')
+    parser.add_argument('-x', '--exclude', type=str, nargs='+', default=[], help='benches to skip')
+    parser.add_argument('-s', '--simulators', type=str, nargs=2, default=['icarus', 'verilator'], help='the two simulators to compare')
+    parser.add_argument('-o', '--output_dir', type=str, default='regression_build/compare', help='directory of the builds and logs')
+    parser.add_argument('-r', '--results', type=str, help='save the comparison as JSON')
+    parser.add_argument('--seed', type=int, help='RANDOM_SEED of all simulations, random if not set')
+    parser.add_argument('make_args', type=str, nargs='*', help='variables passed to make')
+
+    args = parser.parse_args()
+
+    output_dir = pathlib.Path(args.output_dir)
+    seed = args.seed if args.seed is not None else random.randrange(2**31)
+    (first, second) = args.simulators
+
+    results = []
+
+    installed = [simulator for simulator in args.simulators if shutil.which(COMMANDS.get(simulator, simulator))]
+    for simulator in args.simulators:
+        if simulator not in installed:
+            print("Warning: {} is not installed, skipping".format(simulator))
+
+    for bench in find_benches(args.benches, args.exclude):
+        print("Running {}".format(bench["name"]))
+        results.append({simulator : run_simulator(bench, simulator, output_dir, args.make_args, seed)
+                        if simulator in installed else None for simulator in args.simulators})
+        results[-1]["bench"] = bench["name"]
+
+    # Cold includes the compilation, warm reuses the build like further TestFactory runs do
+    print()
+    print("{:<20} {:>8} {:>14} {:>14} {:>14} {:>14} {:>9}".format("bench", "tests", first + " cold/s", first + " warm/s",
+                                                                 second + " cold/s", second + " warm/s", "speedup"))
+
+    for result in results:
+        (first_result, second_result) = (result[first], result[second])
+
+        tests = next((simulator_result["warm"]["tests"] for simulator_result in (first_result, second_result)
+                      if simulator_result is not None), 0)
+
+        speedup = "n/a"
+        if first_result is not None and second_result is not None:
+            speedup = "{:.2f}x".format(first_result["warm"]["wall_time"] / second_result["warm"]["wall_time"])
+
+        print("{:<20} {:>8} {:>14} {:>14} {:>14} {:>14} {:>9}".format(result["bench"], tests,
+                                                                     format_time(first_result, "cold"),
+                                                                     format_time(first_result, "warm"),
+                                                                     format_time(second_result, "cold"),
+                                                                     format_time(second_result, "warm"), speedup))
+
+    if args.results != None:
+        with open(args.results, "w") as f:
+            json.dump({"seed" : seed, "simulators" : args.simulators, "results" : results}, f, indent=4)
+        print("Results saved to {}".format(args.results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Error and spectral metrics and plots of the captures the testbenches save as .npz,
+# kept out of the simulation so no bench pays for matplotlib
+
+import sys
+import json
+import argparse
+import pathlib
+import multiprocessing
+
+import numpy as np
+
+# Captures are searched here if no files are given
+REPO_DIR = pathlib.Path(__file__).resolve().parents[2]
+CAPTURE_GLOB = "design/*/sim/*.npz"
+
+sys.path.insert(0, str(REPO_DIR / "design" / "common" / "testbench"))
+import spectrum
+
+def ideal(num, inc, gain, offset):
+    # Floating point sine for the first num samples, 2f16 like the output
+    phase = (np.arange(num) * inc) & 0xFFFF
+    return np.sin(phase / (1 << 16) * 2 * np.pi) * (gain / (1 << 14)) + offset / (1 << 16)
+
+def process(path, output_dir, formats):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    capture = np.load(path)
+    (time, value) = (capture["time"], capture["value"])
+    (inc, gain, offset) = (int(capture["inc"]), int(capture["gain"]), int(capture["offset"]))
+
+    value_float = value / (1 << 16)
+    error = value_float - ideal(len(value), inc, gain, offset)
+
+    result = {"file" : str(path), "samples" : len(value),
+              "mean_squared_error" : float(np.mean(error**2)),
+              "mean_absolute_error" : float(np.mean(np.abs(error)))}
+
+    # Replaces the curve fit, the capture is coherent once it holds a whole period
+    try:
+        result["spectrum"] = spectrum.metrics(value, inc)
+    except ValueError as e:
+        print("Warning: no spectral metrics for {}: {}".format(path, e))
+
+    fig, ax = plt.subplots(3, 1)
+    fig.suptitle("Stimulus: Sine wave generator, Driver: SPI module", fontsize=24)
+
+    ax[0].scatter(time, value_float, label="SPI data represented as float")
+    ax[0].set(xlabel="time in ns", ylabel="Value")
+    ax[0].legend(loc="best")
+    ax[0].grid()
+
+    ax[1].set(xlabel="time in ns", ylabel="Error")
+    ax[1].plot(time, error, label="error = y_data - y_calc")
+    ax[1].legend(loc="best")
+    ax[1].grid()
+
+    if "spectrum" in result:
+        power = spectrum.power_spectrum(value[:result["spectrum"]["samples"]] / (1 << 16))
+        ax[2].stem(np.arange(len(power)), 10 * np.log10(np.maximum(power, 1e-20)), bottom=-200,
+                   label="SFDR {sfdr_db:.1f} dB, ENOB {enob:.2f}".format(**result["spectrum"]))
+        ax[2].set(xlabel="bin", ylabel="Power in dB")
+        ax[2].legend(loc="best")
+        ax[2].grid()
+
+    fig.set_size_inches(10, 9)
+    plt.tight_layout()
+
+    output_dir = path.parent if output_dir is None else output_dir
+    name = path.stem.replace("capture_", "output_", 1)
+    for output_format in formats:
+        fig.savefig(output_dir / "{}.{}".format(name, output_format), dpi=199)
+    plt.close(fig)
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate and plot the .npz captures of the testbenches")
+    parser.add_argument("files", nargs="*", type=pathlib.Path, help="captures, all of {} if not given".format(CAPTURE_GLOB))
+    parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(), help="captures processed in parallel")
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="directory of the plots, next to each capture if not given")
+    parser.add_argument("-f", "--formats", nargs="+", default=["svg", "png"], help="file formats of the plots")
+    parser.add_argument("-r", "--results", type=pathlib.Path, help="write the metrics of all captures to this JSON file")
+    args = parser.parse_args()
+
+    files = args.files or sorted(REPO_DIR.glob(CAPTURE_GLOB))
+    if not files:
+        print("Error: no captures found")
+        exit(1)
+
+    if args.output is not None:
+        args.output.mkdir(parents=True, exist_ok=True)
+
+    jobs = [(path, args.output, args.formats) for path in files]
+    with multiprocessing.Pool(max(1, min(args.jobs, len(jobs)))) as pool:
+        results = pool.starmap(process, jobs)
+
+    for result in results:
+        print("{}: {} samples, mean squared error {:.3e}, mean absolute error {:.3e}".format(
+              result["file"], result["samples"], result["mean_squared_error"], result["mean_absolute_error"]))
+        if "spectrum" in result:
+            print("    SFDR {sfdr_db:.2f} dB, SNR {snr_db:.2f} dB, THD {thd_db:.2f} dB, ENOB {enob:.2f} over {samples} samples".format(
+                  **result["spectrum"]))
+
+    if args.results is not None:
+        with open(args.results, "w") as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import pathlib
+import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+DESIGN_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+def find_benches(names=None, exclude=()):
+    benches = []
+
+    for makefile in sorted(DESIGN_DIR.glob("*/sim/Makefile")):
+        name = makefile.parent.parent.name
+
+        if names and name not in names:
+            continue
+        if name in exclude:
+            continue
+
+        match = re.search(r"^MODULE\s*:?=\s*(\S+)", makefile.read_text(), re.MULTILINE)
+        if match is None:
+            print("Warning: No MODULE in {}, skipping".format(makefile))
+            continue
+
+        benches.append({"name" : name, "sim_dir" : makefile.parent, "module" : match.group(1)})
+
+    return benches
+
+def run_make(bench, build_dir, results_file, log_file, make_args, env):
+    command = ["make", "-C", str(bench["sim_dir"]), "sim",
+               "SIM_BUILD={}".format(build_dir.resolve()),
+               "COCOTB_RESULTS_FILE={}".format(results_file.resolve())] + make_args
+
+    with open(log_file, "w") as log:
+        start = time.perf_counter()
+        process = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+        wall_time = time.perf_counter() - start
+
+    return (process.returncode, wall_time)
+
+def discover(bench, output_dir, make_args, seed):
+    # The test module can only be imported inside the simulator, this run also builds shard 0
+    bench_dir = output_dir / bench["name"]
+    bench_dir.mkdir(parents=True, exist_ok=True)
+    tests_file = bench_dir / "tests.json"
+
+    env = dict(os.environ, RANDOM_SEED=str(seed), DISCOVER_MODULE=bench["module"], DISCOVER_OUTPUT=str(tests_file.resolve()))
+    env.pop("TESTCASE", None)
+
+    (returncode, _) = run_make(bench, bench_dir / "shard0" / "sim_build", bench_dir / "discover.xml",
+                               bench_dir / "discover.log", make_args + ["MODULE=discover_tests"], env)
+
+    if returncode != 0 or not tests_file.exists():
+        print("Error: Test discovery failed for {}, see {}".format(bench["name"], bench_dir / "discover.log"))
+        return None
+
+    with open(tests_file, "r") as f:
+        return json.load(f)
+
+def run_shard(bench, shard, tests, output_dir, make_args, seed):
+    shard_dir = output_dir / bench["name"] / "shard{}".format(shard)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    results_file = shard_dir / "results.xml"
+    telemetry_file = shard_dir / "telemetry.json"
+
+    # Same seed as the discovery, so TestFactory options built with random are identical
+    env = dict(os.environ, RANDOM_SEED=str(seed), TESTCASE=",".join(tests), TELEMETRY="1", TELEMETRY_FILE=str(telemetry_file.resolve()),
+               CAPTURE_DIR=str(shard_dir.resolve()))
+
+    for old_file in [results_file, telemetry_file]:
+        if old_file.exists():
+            old_file.unlink()
+
+    # The shards of a bench run in the same sim directory, waves and captures go to the shard directory
+    dump_file = shard_dir / "waves.vcd"
+    (returncode, wall_time) = run_make(bench, shard_dir / "sim_build", results_file, shard_dir / "log.txt",
+                                       ["PLUSARGS=+dumpfile={}".format(dump_file.resolve())] + make_args, env)
+
+    return {"bench" : bench["name"], "shard" : shard, "tests" : tests, "returncode" : returncode,
+            "wall_time" : wall_time, "results_file" : results_file, "log_file" : shard_dir / "log.txt",
+            "telemetry_file" : telemetry_file}
+
+def shard_tests(tests, num_shards):
+    # Round robin, TestFactory cases of similar options end up on different shards
+    shards = [tests[shard::num_shards] for shard in range(num_shards)]
+    return [shard for shard in shards if shard]
+
+def merge_results(shard_results, results_file):
+    testsuites = ET.Element("testsuites", name="results")
+    testsuite_of = {}
+    summary = {}
+
+    for shard_result in shard_results:
+        bench = shard_result["bench"]
+
+        if bench not in testsuite_of:
+            testsuite_of[bench] = ET.SubElement(testsuites, "testsuite", name=bench, package=bench)
+            summary[bench] = {"tests" : 0, "failures" : 0, "skipped" : 0, "wall_time" : 0.0}
+
+        testsuite = testsuite_of[bench]
+        summary[bench]["wall_time"] += shard_result["wall_time"]
+        found = set()
+
+        if shard_result["results_file"].exists():
+            for testcase in ET.parse(shard_result["results_file"]).getroot().iter("testcase"):
+                testsuite.append(testcase)
+                found.add(testcase.get("name"))
+
+        # A crashed simulator leaves tests without result
+        for test in shard_result["tests"]:
+            if test not in found:
+                testcase = ET.SubElement(testsuite, "testcase", name=test, classname=bench)
+                ET.SubElement(testcase, "failure", message="No result, see {}".format(shard_result["log_file"]))
+
+    for (bench, testsuite) in testsuite_of.items():
+        testcases = sorted(testsuite.findall("testcase"), key=lambda testcase : testcase.get("name"))
+
+        for testcase in testsuite.findall("testcase"):
+            testsuite.remove(testcase)
+        for testcase in testcases:
+            testsuite.append(testcase)
+
+        summary[bench]["tests"] = len(testcases)
+        summary[bench]["failures"] = sum(1 for testcase in testcases
+                                         if testcase.find("failure") is not None or testcase.find("error") is not None)
+        summary[bench]["skipped"] = sum(1 for testcase in testcases if testcase.find("skipped") is not None)
+
+        testsuite.set("tests", str(summary[bench]["tests"]))
+        testsuite.set("failures", str(summary[bench]["failures"]))
+        testsuite.set("skipped", str(summary[bench]["skipped"]))
+
+    ET.indent(testsuites)
+    ET.ElementTree(testsuites).write(results_file, encoding="utf-8", xml_declaration=True)
+
+    return summary
+
+def merge_telemetry(telemetry_files, output_file, **info):
+    # The tests of all telemetry files of a run in one list, each with the name of its bench
+    tests = []
+    simulators = set()
+
+    for telemetry_file in telemetry_files:
+        if not telemetry_file.exists():
+            continue
+
+        with open(telemetry_file, "r") as f:
+            telemetry = json.load(f)
+
+        simulators.add(telemetry["simulator"])
+        tests += [dict(test, bench=telemetry["bench"]) for test in telemetry["tests"]]
+
+    tests.sort(key=lambda test : (test["bench"], test["name"]))
+    run = dict(info, simulator=",".join(sorted(simulators)), tests=tests)
+
+    with open(output_file, "w") as f:
+        json.dump(run, f, indent=4)
+
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the cocotb benches of all blocks with tests sharded over parallel simulators.')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of simulators running in parallel')
+    parser.add_argument('-s', '--shards', type=int, help='maximum shards per bench, defaults to --jobs')
+    parser.add_argument('-b', '--benches', type=str, nargs='+', help='only run these benches, e.g. wfg_stim_sine')
+    parser.add_argument('-x', '--exclude', type=str, nargs='+', default=[], help='benches to skip')
+    parser.add_argument('-o', '--output_dir', type=str, default='regression_build', help='directory of the builds, logs and results')
+    parser.add_argument('--seed', type=int, help='RANDOM_SEED of all simulations, random if not set')
+    parser.add_argument('make_args', type=str, nargs='*', help='variables passed to make, e.g. SIM=verilator')
+
+    args = parser.parse_args()
+
+    output_dir = pathlib.Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    seed = args.seed if args.seed is not None else random.randrange(2**31)
+    num_shards = args.shards if args.shards is not None else args.jobs
+
+    benches = find_benches(args.benches, args.exclude)
+    if not benches:
+        print("Error: No benches found")
+        sys.exit(1)
+
+    print("Running {} benches with {} jobs, RANDOM_SEED={}".format(len(benches), args.jobs, seed))
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        discovered = list(executor.map(lambda bench : discover(bench, output_dir, args.make_args, seed), benches))
+
+        futures = []
+        shard_results = []
+
+        for (bench, tests) in zip(benches, discovered):
+            if tests is None:
+                # Report the bench as failed without running it
+                shard_results.append({"bench" : bench["name"], "shard" : 0, "tests" : ["discovery"], "returncode" : 1,
+                                      "wall_time" : 0.0, "results_file" : output_dir / bench["name"] / "discover.xml",
+                                      "log_file" : output_dir / bench["name"] / "discover.log"})
+                continue
+
+            names = [test["name"] for test in tests if not test["skip"]]
+            for (shard, shard_names) in enumerate(shard_tests(names, num_shards)):
+                futures.append(executor.submit(run_shard, bench, shard, shard_names, output_dir, args.make_args, seed))
+
+        shard_results += [future.result() for future in futures]
+
+    summary = merge_results(shard_results, output_dir / "results.xml")
+    wall_time = time.perf_counter() - start
+
+    merge_telemetry([shard_result["telemetry_file"] for shard_result in shard_results if "telemetry_file" in shard_result],
+                    output_dir / "telemetry.json", start=time.time() - wall_time, seed=seed, make_args=args.make_args)
+
+    print("{:<20} {:>6} {:>6} {:>6} {:>10}".format("bench", "tests", "fail", "skip", "cpu time/s"))
+    for (bench, result) in summary.items():
+        print("{:<20} {:>6} {:>6} {:>6} {:>10.1f}".format(bench, result["tests"], result["failures"], result["skipped"],
+                                                         result["wall_time"]))
+
+    failures = sum(result["failures"] for result in summary.values())
+    print("Regression done in {:.1f} s, {} failures, results in {}".format(wall_time, failures, output_dir / "results.xml"))
+    print("Telemetry of every test in {}".format(output_dir / "telemetry.json"))
+
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
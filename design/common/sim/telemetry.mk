@@ -0,0 +1,12 @@
+# Per test telemetry of the block benches, include after MODULE is set.
+# A MODULE given on the command line, like the test discovery of regression.py, runs without it.
+# Each run writes wall time, sim time, simulated ns per second, trigger wakeups and peak RSS
+# of every test to TELEMETRY_FILE, see design/common/benchmark.py. Off unless TELEMETRY=1.
+
+TELEMETRY ?= 0
+TELEMETRY_FILE ?= telemetry.json
+
+ifneq ($(TELEMETRY),0)
+MODULE := telemetry,$(MODULE)
+export TELEMETRY_FILE
+endif
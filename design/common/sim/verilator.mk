@@ -0,0 +1,20 @@
+# Verilator settings shared by the block benches, include before Makefile.sim
+
+ifeq ($(SIM),verilator)
+
+# The RTL is written for verible, not for the Verilator lint rules
+COMPILE_ARGS += -Wno-fatal -Wno-lint -Wno-style
+
+# Compiled models are cached by a hash of the sources and everything passed to Verilator,
+# benches, regression shards and TestFactory cases with the same hash reuse one build.
+# Set MODEL_CACHE to an empty value to build into SIM_BUILD as usual.
+MODEL_CACHE ?= $(abspath $(dir $(lastword $(MAKEFILE_LIST)))../../../.sim_cache)
+
+ifneq ($(MODEL_CACHE),)
+MODEL_HASH := $(shell (cat $(VERILOG_SOURCES); \
+                       echo '$(TOPLEVEL) $(COMPILE_ARGS) $(EXTRA_ARGS) $(COCOTB_HDL_TIMEUNIT) $(COCOTB_HDL_TIMEPRECISION)'; \
+                       verilator --version; cocotb-config --version) | sha256sum | cut -c1-16)
+override SIM_BUILD := $(MODEL_CACHE)/$(TOPLEVEL)-$(MODEL_HASH)
+endif
+
+endif
@@ -0,0 +1,54 @@
+// SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+// SPDX-License-Identifier: Apache-2.0
+
+// Records the beats of an AXI stream inside the simulator, RecorderCapture in capture.py
+// reads the whole recording at once at the end of a test
+
+`default_nettype none
+module axis_recorder #(
+    parameter int DATA_WIDTH = 32,
+    parameter int DEPTH      = 1024
+) (
+    input wire clk,   // I; System clock
+    input wire rst_n, // I; Active low reset
+
+    input wire                  tvalid,  // I; valid
+    input wire                  tready,  // I; ready
+    input wire [DATA_WIDTH-1:0] tdata    // I; data
+);
+
+    // Flat vectors instead of unpacked arrays, so each memory is a single VPI value
+    logic [DEPTH*DATA_WIDTH-1:0] data_mem;  // tdata of the last DEPTH beats
+    logic [       DEPTH*32-1:0] cycle_mem;  // Clock cycle of the last DEPTH beats
+
+    logic [31:0] cycle;  // Clock cycles since reset
+    logic [31:0] count;  // Beats since reset
+    logic [31:0] index;  // Next entry of the memories
+
+    // Written from Python, reached rises as soon as count gets there
+    logic [31:0] target;
+    logic reached;
+
+    initial target = '1;
+    assign reached = count >= target;
+
+    always_ff @(posedge clk or negedge rst_n) begin
+        if (!rst_n) begin
+            data_mem  <= '0;
+            cycle_mem <= '0;
+            cycle     <= '0;
+            count     <= '0;
+            index     <= '0;
+        end else begin
+            cycle <= cycle + 1;
+
+            if (tvalid && tready) begin
+                data_mem[index*DATA_WIDTH+:DATA_WIDTH] <= tdata;
+                cycle_mem[index*32+:32] <= cycle;
+                count <= count + 1;
+                index <= (index == DEPTH - 1) ? '0 : index + 1;
+            end
+        end
+    end
+endmodule
+`default_nettype wire
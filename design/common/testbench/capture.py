@@ -0,0 +1,317 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Capture of DUT signals into preallocated NumPy buffers, Python only runs when something is recorded
+
+import abc
+import numpy as np
+import cocotb
+from cocotb.triggers import Edge, RisingEdge, FallingEdge, Event
+from cocotb.utils import get_sim_time, get_time_from_sim_steps
+
+class RingBuffer:
+    # Fixed size columns, when full the oldest rows are overwritten
+    def __init__(self, size, columns):
+        self.size = int(size)
+        self.names = list(columns)
+        self.columns = [np.zeros(self.size, dtype=dtype) for dtype in columns.values()]
+        self.count = 0
+
+    def append(self, *values):
+        index = self.count % self.size
+        for (column, value) in zip(self.columns, values):
+            column[index] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    @property
+    def dropped(self):
+        return max(0, self.count - self.size)
+
+    def clear(self):
+        self.count = 0
+
+    def arrays(self):
+        # Copies of all columns in the order the rows were appended
+        index = self.count % self.size
+
+        if self.count <= self.size:
+            return {name : column[:self.count].copy() for (name, column) in zip(self.names, self.columns)}
+        return {name : np.concatenate((column[index:], column[:index])) for (name, column) in zip(self.names, self.columns)}
+
+class Capture(abc.ABC):
+    # Subclasses record in _run, which start() runs as a task
+    def __init__(self, signal, size, signed=False, columns=()):
+        if len(signal) > 64:
+            raise ValueError("{} is wider than 64 bits".format(signal._name))
+
+        self.signal = signal
+        self.signed = signed
+        self.buffer = RingBuffer(size, dict([("time", np.int64), ("value", np.int64 if signed else np.uint64)] + list(columns)))
+        self._task = None
+        self._wait_count = None
+        self._wait_event = Event()
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def clear(self):
+        self.buffer.clear()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    @property
+    def count(self):
+        # Records since the start, including the overwritten ones
+        return self.buffer.count
+
+    @property
+    def dropped(self):
+        return self.buffer.dropped
+
+    async def wait(self, count):
+        # Wait until count records have been captured
+        if self.buffer.count < count:
+            self._wait_count = count
+            self._wait_event.clear()
+            await self._wait_event.wait()
+
+    def _record(self, *values):
+        self.buffer.append(get_sim_time(), *values)
+
+        if self._wait_count is not None and self.buffer.count >= self._wait_count:
+            self._wait_count = None
+            self._wait_event.set()
+
+    def _read(self):
+        value = self.signal.value
+        return value.signed_integer if self.signed else value.integer
+
+    def arrays(self, units=None):
+        # Columns of all captured records, time in simulator steps or the given units
+        arrays = self.buffer.arrays()
+        if units is not None:
+            arrays["time"] = arrays["time"] * get_time_from_sim_steps(1, units)
+        return arrays
+
+    @abc.abstractmethod
+    async def _run(self):
+        pass
+
+class ChangeCapture(Capture):
+    # Records the signal each time its value changes, x and z bits are recorded as zero with their mask
+    def __init__(self, signal, size=1 << 16, signed=False):
+        super().__init__(signal, size, signed, columns=[("xz_mask", np.uint64)])
+
+    def _record_value(self):
+        value = self.signal.value
+
+        if value.is_resolvable:
+            self._record(value.signed_integer if self.signed else value.integer, 0)
+        else:
+            binstr = value.binstr
+            known = int(binstr.translate(str.maketrans("xzXZ", "0000")), 2)
+            xz_mask = int(binstr.translate(str.maketrans("01xzXZ", "001111")), 2)
+            self._record(known, xz_mask)
+
+    async def _run(self):
+        self._record_value()
+        while True:
+            await Edge(self.signal)
+            self._record_value()
+
+class StreamCapture(Capture):
+    # Records the data of each valid/ready handshake, sampled in the middle of the clock cycle
+    def __init__(self, clk, data, valid, ready=None, size=1 << 16, signed=False):
+        super().__init__(data, size, signed)
+        self.clk = clk
+        self.valid = valid
+        self.ready = ready
+
+    async def _run(self):
+        clkedge = FallingEdge(self.clk)
+
+        while True:
+            # Idle cycles cost nothing, the clock is only followed while valid is high
+            if self.valid.value.binstr != "1":
+                await RisingEdge(self.valid)
+            await clkedge
+
+            if self.valid.value.binstr == "1" and (self.ready is None or self.ready.value.binstr == "1"):
+                self._record(self._read())
+
+def unpack_memory(handle, width):
+    # Entries of a flat memory vector of axis_recorder, entry 0 first, x and z bits read as zero
+    binstr = handle.value.binstr
+    depth = len(binstr) // width
+
+    bits = (np.frombuffer(binstr.encode(), dtype=np.uint8) == ord("1")).reshape(depth, width)[::-1]
+    padded = np.zeros((depth, 64), dtype=bool)
+    padded[:, 64 - width:] = bits
+
+    return np.packbits(padded, axis=1).view(">u8").reshape(depth).astype(np.uint64)
+
+class RecorderCapture:
+    # Stream beats recorded by an axis_recorder instance, only waiting and the final readout cross into Python
+    # Beats recorded before the capture was created are not part of it
+    def __init__(self, recorder, signed=False):
+        self.recorder = recorder
+        self.signed = signed
+        self.depth = len(recorder.cycle_mem) // 32
+        self.width = len(recorder.data_mem) // self.depth
+        self.clear()
+
+    @property
+    def count(self):
+        # Beats since the creation or the last clear, including the overwritten ones
+        return self.recorder.count.value.integer - self.start_count
+
+    @property
+    def dropped(self):
+        return max(0, self.count - self.depth)
+
+    def __len__(self):
+        return min(self.count, self.depth)
+
+    def clear(self):
+        self.start_count = self.recorder.count.value.integer
+
+    async def wait(self, count):
+        # The recorder compares the count itself, Python only wakes up once
+        if self.count < count:
+            self.recorder.target.value = self.start_count + count
+            await RisingEdge(self.recorder.reached)
+
+    async def stream(self, count, chunk=None):
+        # Consecutive chunks of the next count beats, each read before the recorder overwrites it
+        chunk = min(chunk or self.depth // 2, self.depth)
+        done = 0
+
+        while done < count:
+            size = min(chunk, count - done)
+            await self.wait(done + size)
+
+            if self.count - done > self.depth:
+                raise RuntimeError("Beats {} to {} were overwritten before they were read".format(done, self.count - self.depth - 1))
+
+            arrays = self.arrays()
+            first = len(self) - (self.count - done)
+            yield {name : column[first:first + size] for (name, column) in arrays.items()}
+            done += size
+
+    def arrays(self):
+        # Columns of the recorded beats, the time as clock cycles since reset
+        total = self.recorder.count.value.integer
+        num = len(self)
+
+        # Oldest entry first, the ring index follows the total count
+        order = (np.arange(total - num, total) % self.depth).astype(np.int64)
+        cycle = unpack_memory(self.recorder.cycle_mem, 32)[order].astype(np.int64)
+        value = unpack_memory(self.recorder.data_mem, self.width)[order]
+
+        if self.signed:
+            value = value.astype(np.int64)
+            value = np.where(value >= 1 << (self.width - 1), value - (1 << self.width), value)
+
+        return {"cycle" : cycle, "value" : value}
+
+def sign_extend(values, bits):
+    # Two's complement value of the low bits of each word
+    values = np.asarray(values, dtype=np.int64) & ((1 << bits) - 1)
+    return values - ((values >> (bits - 1)) << bits)
+
+def decode_spi(sclk, sdo, cs_n, width, cpol=0, lsbfirst=0, sspol=0):
+    # Frames of a SPI bus from the arrays of a ChangeCapture of each pin, sdo is sampled at the leading
+    # edge of sclk while cs_n is at its active level sspol, frames which did not end yet are left out
+    # Returns the start and end time, the word and the number of bits of each frame
+    # A frame already running at the first record is incomplete and left out as well
+    (cs_time, cs_active) = (cs_n["time"], cs_n["value"] == sspol)
+    cs_prev = np.concatenate((cs_active[:1], cs_active[:-1]))
+    starts = cs_time[cs_active & ~cs_prev]
+    ends = cs_time[~cs_active & cs_prev]
+
+    end_index = np.searchsorted(ends, starts, side="right")
+    starts = starts[end_index < len(ends)]
+    ends = ends[end_index[end_index < len(ends)]]
+
+    # Leading edges leave the idle level cpol, the first record is the initial value and no edge
+    (sclk_time, sclk_value) = (sclk["time"], sclk["value"])
+    leading = sclk_time[1:][(sclk_value[1:] != cpol) & (sclk_value[:-1] == cpol)]
+
+    frame = np.searchsorted(starts, leading, side="right") - 1
+    inside = (frame >= 0) & (leading < ends[np.maximum(frame, 0)]) if len(starts) else np.zeros(len(leading), dtype=bool)
+    (leading, frame) = (leading[inside], frame[inside])
+
+    # Value of sdo just before each edge
+    index = np.searchsorted(sdo["time"], leading, side="left") - 1
+    bit = np.where(index >= 0, sdo["value"][np.maximum(index, 0)], 0).astype(np.int64) & 1
+
+    counts = np.bincount(frame, minlength=len(starts))
+    position = np.arange(len(frame)) - (np.cumsum(counts) - counts)[frame]
+    keep = position < width
+
+    bits = np.zeros((len(starts), width), dtype=np.int64)
+    bits[frame[keep], position[keep]] = bit[keep]
+
+    # Weight of each bit on the wire, the reversal for LSB first frames is only a different table
+    weights = np.left_shift(1, np.arange(width) if lsbfirst else np.arange(width - 1, -1, -1)).astype(np.int64)
+
+    return {"start" : starts, "end" : ends, "value" : (bits @ weights).astype(np.uint64), "bits" : counts}
+
+class SpiCapture:
+    # Records the pins of a SPI bus with a ChangeCapture each and decodes all frames at the end,
+    # start it while the bus is idle, wfg_drive_spi drives cs_no low during reset
+    def __init__(self, sclk, sdo, cs_n, width, cpol=0, lsbfirst=0, sspol=0, size=1 << 16):
+        self.captures = [ChangeCapture(signal, size) for signal in (sclk, sdo, cs_n)]
+        self.format = dict(width=width, cpol=cpol, lsbfirst=lsbfirst, sspol=sspol)
+
+    def start(self):
+        for capture in self.captures:
+            capture.start()
+        return self
+
+    def stop(self):
+        for capture in self.captures:
+            capture.stop()
+
+    @property
+    def dropped(self):
+        return sum(capture.dropped for capture in self.captures)
+
+    async def wait(self, frames):
+        # After the initial record each frame changes cs_n twice
+        await self.captures[2].wait(1 + 2 * frames)
+
+    def frames(self, units=None):
+        (sclk, sdo, cs_n) = (capture.arrays(units) for capture in self.captures)
+        return decode_spi(sclk, sdo, cs_n, **self.format)
+
+    async def stream(self, count, chunk=256):
+        # Consecutive chunks of the next count frames, each decoded while the ring buffers still hold it
+        (done, last_end) = (0, -1)
+
+        while done < count:
+            size = min(chunk, count - done)
+            await self.wait(done + size)
+
+            arrays = [capture.arrays() for capture in self.captures]
+            frames = decode_spi(*arrays, **self.format)
+            new = np.flatnonzero(frames["end"] > last_end)[:size]
+
+            oldest = max(pin["time"][0] for pin in arrays)
+            if len(new) < size or any(capture.dropped for capture in self.captures) and oldest > frames["start"][new[0]]:
+                raise RuntimeError("SPI frames {} to {} were overwritten before they were decoded".format(done, done + size - 1))
+
+            last_end = frames["end"][new[-1]]
+            yield {name : column[new] for (name, column) in frames.items()}
+            done += size
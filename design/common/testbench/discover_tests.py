@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Used as MODULE by regression.py: imports the test module inside the simulator,
+# writes the names of its tests to DISCOVER_OUTPUT and runs no test itself
+
+import os
+import json
+import importlib
+import cocotb
+
+module = importlib.import_module(os.environ["DISCOVER_MODULE"])
+
+tests = [{"name" : name, "skip" : bool(getattr(thing, "skip", False))}
+         for (name, thing) in vars(module).items() if isinstance(thing, cocotb.test)]
+
+with open(os.environ["DISCOVER_OUTPUT"], "w") as f:
+    json.dump(tests, f, indent=4)
@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Bit-plane model of wfg_drive_pat, all 32 channels are packed into one uint32 per clock
+
+import itertools
+import numpy as np
+
+CHANNELS = 32
+ONES = np.uint32((1 << CHANNELS) - 1)
+
+# Output formats as selected by {PATSEL1.HIGH[k], PATSEL0.LOW[k]}
+RZ = 0
+RO = 1
+NRZ = 2
+RC = 3
+
+def patsel(patterns):
+    # Register values of PATSEL0 and PATSEL1 for a list of per channel formats
+    low = sum((pattern & 1) << channel for (channel, pattern) in enumerate(patterns))
+    high = sum(((pattern >> 1) & 1) << channel for (channel, pattern) in enumerate(patterns))
+    return (low, high)
+
+def step(subcycle, data, word, en, low, high, begin, end):
+    # data_next of all channels for one clock, data is data_ff and word is axis_data_ff
+    data_next = data
+
+    if subcycle == begin:
+        data_next = word
+
+    if subcycle == end:
+        ro = low & ~high
+        nrz = high & ~low
+        rc = high & low
+
+        # RZ channels go to zero, NRZ keeps data_ff and RC gets the complement of the data
+        data_next = (ONES & ro) | (data & nrz) | (~word & rc)
+
+    return data_next & en
+
+def run_period(state, words, en, low, high, begin, end, subcycles, output=None):
+    # Steps all periods at once, output gets the data_ff seen during each subcycle
+    for subcycle in range(subcycles):
+        if output is not None:
+            output[:, subcycle] = state
+        state = step(subcycle, state, words, en, low, high, begin, end)
+
+    return state
+
+def drive_pat(words, en, patsel_low, patsel_high, begin, end, subcycles=24, initial=0):
+    # words holds axis_data_ff of each sync period, the word latched by the sync before the period
+    # Returns pat_dout_o and a mask of the channels at high impedance, shape (periods, subcycles)
+    words = np.asarray(words, dtype=np.uint64).astype(np.uint32)
+    (en, low, high) = (np.uint32(en & ONES), np.uint32(patsel_low & ONES), np.uint32(patsel_high & ONES))
+
+    # The state at the end of a period either follows from the word of the period
+    # or, for channels without a begin or end event, is the state at the start of it
+    final_zero = run_period(np.zeros_like(words), words, en, low, high, begin, end, subcycles)
+    final_ones = run_period(np.full_like(words, ONES), words, en, low, high, begin, end, subcycles)
+    keep = final_zero ^ final_ones
+
+    initial = np.uint32(initial & ONES)
+    start = np.empty_like(words)
+    start[0] = initial
+    start[1:] = (initial & keep[:-1]) | (final_zero[:-1] & ~keep[:-1])
+
+    value = np.empty((len(words), subcycles), dtype=np.uint32)
+    run_period(start, words, en, low, high, begin, end, subcycles, value)
+
+    z_mask = np.full_like(value, ~en)
+    return (value, z_mask)
+
+def stream(words, en, patsel_low, patsel_high, begin, end, subcycles=24, initial=0, periods=64):
+    # drive_pat over any iterable of words, evaluated lazily a few periods at a time
+    # Yields pat_dout_o and the high impedance mask of each clock, flat arrays of up to periods * subcycles
+    words = iter(words)
+    args = (np.uint32(en & ONES), np.uint32(patsel_low & ONES), np.uint32(patsel_high & ONES), begin, end, subcycles)
+
+    while True:
+        chunk = np.fromiter(itertools.islice(words, periods), dtype=np.uint64).astype(np.uint32)
+        if len(chunk) == 0:
+            return
+
+        (value, z_mask) = drive_pat(chunk, en, patsel_low, patsel_high, begin, end, subcycles, initial)
+
+        # The last period from its start state gives the state the next chunk starts with
+        initial = int(run_period(value[-1:, 0], chunk[-1:], *args)[0])
+        yield (value.reshape(-1), z_mask.reshape(-1))
+
+def to_string(value, z_mask):
+    # Same format as str() of a cocotb BinaryValue of pat_dout_o, MSB first
+    return "".join("z" if (z_mask >> channel) & 1 else str((value >> channel) & 1)
+                   for channel in reversed(range(CHANNELS)))
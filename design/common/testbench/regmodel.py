@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+
+def parse_literal(literal):
+    # SystemVerilog style literals as used in the register CSV files: 4'hC, 2'b00, 0
+    literal = str(literal).strip().replace("_", "")
+
+    if "'" not in literal:
+        return int(literal, 0)
+
+    (_, value) = literal.split("'")
+    base = {"h" : 16, "b" : 2, "d" : 10, "o" : 8}[value[0].lower()]
+    return int(value[1:], base)
+
+class Field:
+    __slots__ = ("name", "msb", "lsb", "width", "shift", "mask", "max_value", "reset", "access")
+
+    def __init__(self, msb, lsb, reset=0, access="rw"):
+        self.name = None
+        self.msb = int(msb)
+        self.lsb = int(lsb)
+        self.width = self.msb - self.lsb + 1
+        self.shift = self.lsb
+        self.max_value = (1 << self.width) - 1
+        self.mask = self.max_value << self.shift
+        self.reset = parse_literal(reset)
+        self.access = access
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, register, owner=None):
+        if register is None:
+            return self
+        return (register.value & self.mask) >> self.shift
+
+    def __set__(self, register, value):
+        register.value = (register.value & ~self.mask) | self.encode(value)
+
+    def encode(self, value):
+        # Accepts a single value or an array of values
+        if isinstance(value, (int, np.integer)):
+            if value < 0 or value > self.max_value:
+                raise ValueError("{} does not fit into {} bits of field {}".format(value, self.width, self.name))
+            return int(value) << self.shift
+
+        value = np.asarray(value, dtype=np.uint64)
+        if np.any(value > self.max_value):
+            raise ValueError("Values do not fit into {} bits of field {}".format(self.width, self.name))
+        return value << np.uint64(self.shift)
+
+    def decode(self, words):
+        if isinstance(words, (int, np.integer)):
+            return (int(words) & self.mask) >> self.shift
+
+        words = np.asarray(words, dtype=np.uint64)
+        return ((words & np.uint64(self.mask)) >> np.uint64(self.shift)).astype(np.uint32)
+
+    def __repr__(self):
+        return "Field({}[{}:{}])".format(self.name, self.msb, self.lsb)
+
+class Register:
+    __slots__ = ("value",)
+
+    name = None
+    address = 0
+    fields = ()
+    reset = 0
+    mask = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        cls.name = cls.__name__
+        cls.address = parse_literal(cls.address)
+        cls.fields = tuple(value for value in vars(cls).values() if isinstance(value, Field))
+
+        # Precompute the image of the register after reset
+        cls.reset = 0
+        cls.mask = 0
+        for field in cls.fields:
+            cls.reset |= field.reset << field.shift
+            cls.mask |= field.mask
+
+    def __init__(self, value=None, **fields):
+        self.value = self.reset if value is None else int(value)
+
+        for (name, field_value) in fields.items():
+            self.field(name).__set__(self, field_value)
+
+    @classmethod
+    def field(cls, name):
+        field = getattr(cls, name.upper(), None)
+
+        if not isinstance(field, Field):
+            raise KeyError("Register {} has no field {}".format(cls.name, name))
+        return field
+
+    @classmethod
+    def encode(cls, **fields):
+        # Fields not given keep their reset value, arrays give one register image per element
+        clear_mask = 0
+        values = []
+
+        for (name, value) in fields.items():
+            field = cls.field(name)
+            clear_mask |= field.mask
+            values.append(field.encode(value))
+
+        word = cls.reset & ~clear_mask
+
+        if all(isinstance(value, int) for value in values):
+            for value in values:
+                word |= value
+            return word
+
+        word = np.uint64(word)
+        for value in values:
+            word = word | value
+        return np.asarray(word, dtype=np.uint32)
+
+    @classmethod
+    def decode(cls, words):
+        return {field.name : field.decode(words) for field in cls.fields}
+
+    def __int__(self):
+        return self.value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.value == other.value
+
+    def __repr__(self):
+        fields = ", ".join("{}={}".format(field.name, field.__get__(self)) for field in self.fields)
+        return "{}({})".format(self.name, fields)
+
+class Peripheral:
+    name = None
+    base = 0
+    registers = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        cls.name = cls.__name__
+        registers = [value for value in vars(cls).values() if isinstance(value, type) and issubclass(value, Register)]
+        cls.registers = tuple(sorted(registers, key=lambda register : register.address))
+
+    @classmethod
+    def register(cls, name):
+        register = getattr(cls, name.upper(), None)
+
+        if not (isinstance(register, type) and issubclass(register, Register)):
+            raise KeyError("Peripheral {} has no register {}".format(cls.name, name))
+        return register
+
+    @classmethod
+    def address(cls, register):
+        # Address of a register in the wishbone map of wfg_top
+        if isinstance(register, str):
+            register = cls.register(register)
+        return (cls.base << 4) | (register.address & 0xF)
+
+    @classmethod
+    def encode(cls, **registers):
+        # Register images as (local address, word), each register given as a dict of fields or a raw word
+        writes = []
+
+        for (name, fields) in registers.items():
+            register = cls.register(name)
+
+            if isinstance(fields, dict):
+                writes.append((register.address, register.encode(**fields)))
+            else:
+                writes.append((register.address, fields))
+
+        return writes
+
+    @classmethod
+    def decode(cls, images):
+        # Images as a dict of local address to word or array of words
+        by_address = {register.address : register for register in cls.registers}
+        return {by_address[address].name : by_address[address].decode(words) for (address, words) in images.items()}
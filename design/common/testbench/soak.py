@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Streaming checks for soak runs of millions of samples: the outputs are compared chunk by chunk,
+# statistics are merged into accumulators of fixed size and nothing grows with the number of samples
+
+import os
+import json
+import numpy as np
+
+def samples():
+    # Number of samples of the soak tests, SOAK=<samples> enables them
+    return int(os.environ.get("SOAK", "0") or 0)
+
+class RunningStats:
+    # Count, mean, variance, minimum and maximum, merged chunk by chunk like Welford's algorithm
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+
+        # Chan's combination of the statistics of the chunk with the ones so far
+        (count, mean) = (len(values), values.mean())
+        m2 = np.sum((values - mean)**2)
+        total = self.count + count
+        delta = mean - self.mean
+
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def as_dict(self):
+        return {"count" : self.count, "mean" : float(self.mean), "std" : float(self.std),
+                "min" : float(self.min) if self.count else None, "max" : float(self.max) if self.count else None}
+
+class Histogram:
+    # Fixed bins, values outside of the range are counted separately
+    def __init__(self, low, high, bins=64):
+        self.edges = np.linspace(low, high, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.counts += np.histogram(values, self.edges)[0]
+        self.below += int(np.count_nonzero(values < self.edges[0]))
+        self.above += int(np.count_nonzero(values > self.edges[-1]))
+
+    def as_dict(self):
+        return {"edges" : self.edges.tolist(), "counts" : self.counts.tolist(), "below" : self.below, "above" : self.above}
+
+class SoakCheck:
+    # Exact comparison with a model and statistics of the deviation from an ideal reference.
+    # The first failing sample of a chunk is logged and raised at once, not after the run.
+    def __init__(self, name, log, max_deviation=None, histogram_range=None, bins=64):
+        self.name = name
+        self.log = log
+        self.max_deviation = max_deviation
+        self.samples = 0
+        self.stats = RunningStats()
+        self.abs_stats = RunningStats()
+        self.histogram = Histogram(*histogram_range, bins) if histogram_range is not None else None
+
+    def check(self, got, expected, deviation=None):
+        got = np.asarray(got)
+        first = self.samples
+        self.samples += len(got)
+
+        mismatches = np.flatnonzero(got != expected)
+        if len(mismatches):
+            index = mismatches[0]
+            message = "{}: sample {} is {}, expected {} ({} mismatches in samples {} to {})".format(
+                self.name, first + index, got[index], np.asarray(expected)[index], len(mismatches), first, self.samples - 1)
+            self.log.error(message)
+            raise AssertionError(message)
+
+        if deviation is None:
+            return
+
+        self.stats.update(deviation)
+        self.abs_stats.update(np.abs(deviation))
+        if self.histogram is not None:
+            self.histogram.update(deviation)
+
+        if self.max_deviation is not None and self.abs_stats.max > self.max_deviation:
+            index = int(np.argmax(np.abs(deviation)))
+            message = "{}: sample {} deviates by {:.3e}, more than {:.3e}".format(self.name, first + index, deviation[index],
+                                                                                 self.max_deviation)
+            self.log.error(message)
+            raise AssertionError(message)
+
+    def report(self):
+        if self.abs_stats.count == 0:
+            self.log.info("{}: {} samples match".format(self.name, self.samples))
+            return
+
+        self.log.info("{}: {} samples match, deviation mean {:.3e}, std {:.3e}, mean abs {:.3e}, max abs {:.3e}".format(
+                      self.name, self.samples, self.stats.mean, self.stats.std, self.abs_stats.mean, self.abs_stats.max))
+
+    def as_dict(self):
+        return {"samples" : self.samples, "deviation" : self.stats.as_dict(), "abs_deviation" : self.abs_stats.as_dict(),
+                "histogram" : self.histogram.as_dict() if self.histogram is not None else None}
+
+def save(checks, path):
+    with open(path, "w") as f:
+        json.dump({check.name : check.as_dict() for check in checks}, f, indent=4)
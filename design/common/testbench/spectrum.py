@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Spectral metrics of wfg_stim_sine output: SFDR, SNR, THD, SINAD and ENOB from one FFT.
+# The phase advances by INC per sample, so a record of whole periods is coherent and needs no window:
+# all power of the sine falls into one bin and every other bin is distortion or noise.
+
+import math
+import time
+import argparse
+import numpy as np
+import stim_sine_model
+
+PHASE_BITS = 16
+
+def coherent_period(inc):
+    # Samples until the phase repeats and the number of sine cycles within them
+    inc = int(inc) & ((1 << PHASE_BITS) - 1)
+    if inc == 0:
+        raise ValueError("inc 0 does not produce a sine")
+    if inc == 1 << (PHASE_BITS - 1):
+        raise ValueError("inc {} puts the sine at Nyquist, where it has no usable power".format(hex(inc)))
+
+    divisor = math.gcd(inc, 1 << PHASE_BITS)
+    return ((1 << PHASE_BITS) // divisor, inc // divisor)
+
+def coherent_length(inc, min_samples=1):
+    # Shortest record of whole periods with at least min_samples samples
+    (period, _) = coherent_period(inc)
+    return -(-max(int(min_samples), 1) // period) * period
+
+def power_spectrum(values):
+    # One sided power of each bin, normalized so the bins add up to the mean square of the record
+    values = np.asarray(values, dtype=np.float64)
+    power = np.abs(np.fft.rfft(values))**2 / len(values)**2
+    power[1:(len(values) + 1) // 2] *= 2
+    return power
+
+def harmonic_bins(fundamental, num, harmonics):
+    # Bins of the 2nd up to the given harmonic after aliasing, without DC and the fundamental
+    bins = (np.arange(2, harmonics + 1) * fundamental) % num
+    bins = np.minimum(bins, num - bins)
+    return np.setdiff1d(bins, [0, fundamental])
+
+def decibel(ratio):
+    with np.errstate(divide="ignore"):
+        return float(10 * np.log10(ratio))
+
+def metrics(values, inc, harmonics=9):
+    # Metrics of a capture in any unit, the record is cut to whole periods
+    (period, cycles) = coherent_period(inc)
+    num = len(values) // period * period
+    if num == 0:
+        raise ValueError("{} samples are less than one period of {} samples".format(len(values), period))
+
+    power = power_spectrum(values[:num])
+
+    # An inc above half the phase range aliases below Nyquist
+    fundamental = cycles * (num // period)
+    fundamental = min(fundamental, num - fundamental)
+    harmonic = harmonic_bins(fundamental, num, harmonics)
+
+    signal = power[fundamental]
+    distortion = power[harmonic].sum()
+
+    # With harmonics in every bin the remainder is rounding error
+    noise = power[1:].sum() - signal - distortion
+    noise = noise if noise > 1e-12 * signal else 0.0
+    spurs = np.delete(power, [0, fundamental])
+    sinad = decibel(signal / (noise + distortion)) if noise + distortion > 0 else math.inf
+
+    return {"samples" : num, "bin" : fundamental,
+            "sfdr_db" : decibel(signal / spurs.max()) if len(spurs) and spurs.max() > 0 else math.inf,
+            "snr_db" : decibel(signal / noise) if noise > 0 else math.inf,
+            "thd_db" : decibel(distortion / signal),
+            "sinad_db" : sinad,
+            "enob" : (sinad - 1.76) / 6.02}
+
+def model_metrics(inc, gain=0x4000, offset=0, samples=None, harmonics=9):
+    # Metrics of the bit-exact model, one period unless a longer record is requested
+    num = coherent_length(inc, samples or 1)
+    values = stim_sine_model.stim_sine(stim_sine_model.phases(inc, num), gain, offset)
+    return metrics(values, inc, harmonics)
+
+def main():
+    parser = argparse.ArgumentParser(description='Spectral metrics of the bit-exact wfg_stim_sine model.')
+    parser.add_argument('--incs', type=lambda x: int(x, 0), nargs='+', default=[0x0001, 0x0123, 0x0500, 0x1000], help='phase increments')
+    parser.add_argument('--gains', type=lambda x: int(x, 0), nargs='+', default=[0x4000], help='gain values')
+    parser.add_argument('--offsets', type=lambda x: int(x, 0), nargs='+', default=[0], help='offset values')
+    parser.add_argument('-n', '--samples', type=int, help='minimum record length, one period of each inc if not set')
+    parser.add_argument('--harmonics', type=int, default=9, help='highest harmonic counted as distortion')
+
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>8}".format("inc", "gain", "offset", "samples", "SFDR/dB",
+                                                                       "SNR/dB", "THD/dB", "ENOB"))
+    start = time.perf_counter()
+    total = 0
+
+    for inc in args.incs:
+        for gain in args.gains:
+            for offset in args.offsets:
+                result = model_metrics(inc, gain, offset, args.samples, args.harmonics)
+                total += result["samples"]
+
+                print("{:>8} {:>8} {:>8} {:>10} {:>10.2f} {:>10.2f} {:>10.2f} {:>8.2f}".format(hex(inc), hex(gain), hex(offset),
+                      result["samples"], result["sfdr_db"], result["snr_db"], result["thd_db"], result["enob"]))
+
+    print("{} samples analyzed in {:.3f} s".format(total, time.perf_counter() - start))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Bit-exact model of wfg_stim_sine, all functions take scalars or arrays
+
+import argparse
+import functools
+import numpy as np
+
+# 0.60725*2^16, the initial x of the CORDIC
+K = 0x9b74
+
+# Angle of each rotation, same table as rot[] in the RTL
+ROT = np.array([0x2000, 0x12e4, 0x09fb, 0x0511, 0x028b, 0x0145, 0x00a3, 0x0051,
+                0x0028, 0x0014, 0x000a, 0x0005, 0x0003, 0x0001, 0x0001, 0x0000], dtype=np.int64)
+
+def wrap(value, bits):
+    # Two's complement overflow of a signed register with the given width
+    return ((value + (1 << (bits - 1))) & ((1 << bits) - 1)) - (1 << (bits - 1))
+
+def cordic(phase):
+    # sin_17 after ST_QUADRANT for a 16 bit phase
+    phase = np.asarray(phase, dtype=np.int64) & 0xFFFF
+
+    quadrant = phase >> 14
+    x = np.full(phase.shape, K, dtype=np.int64)
+    y = np.zeros(phase.shape, dtype=np.int64)
+    z = phase & 0x3FFF
+
+    # x, y and z are 17 bit registers
+    for (iteration, rot) in enumerate(ROT):
+        negative = z < 0
+        x_shifted = x >> iteration
+        y_shifted = y >> iteration
+
+        x = wrap(np.where(negative, x + y_shifted, x - y_shifted), 17)
+        y = wrap(np.where(negative, y - x_shifted, y + x_shifted), 17)
+        z = wrap(np.where(negative, z + rot, z - rot), 17)
+
+    sin_17 = np.select([quadrant == 0, quadrant == 1, quadrant == 2], [y, x, -y], -x)
+    return wrap(sin_17, 17)
+
+@functools.lru_cache(maxsize=1)
+def cordic_table():
+    # sin_17 of all 65536 phases
+    table = cordic(np.arange(1 << 16))
+    table.setflags(write=False)
+    return table
+
+def scale(sin_17, gain, offset):
+    # ST_GAIN, ST_OFFSET and the saturation in ST_DONE, returns sin_18
+    sin_17 = np.asarray(sin_17, dtype=np.int64)
+    gain = np.minimum(np.asarray(gain, dtype=np.int64) & 0xFFFF, 0x7FFF)
+    offset = wrap(np.asarray(offset, dtype=np.int64), 18)
+
+    # Only temp[31:0] is used, the product never overflows 32 bits
+    temp = sin_17 * gain
+    overflow_chk = wrap((temp >> 14) + offset, 18)
+
+    underflow = (temp < 0) & (offset < 0) & (overflow_chk >= 0)
+    overflow = (temp >= 0) & (offset >= 0) & (overflow_chk < 0)
+
+    return np.where(underflow, -(1 << 17), np.where(overflow, (1 << 17) - 1, overflow_chk))
+
+def phases(inc, num, start=0):
+    # Phase of each sample, phase_in advances by inc after every transfer
+    return (start + np.arange(num, dtype=np.int64) * (int(inc) & 0xFFFF)) & 0xFFFF
+
+def stim_sine(phase, gain=0x4000, offset=0):
+    # Output for the given phases, the value of wfg_axis_tdata_o as signed integer
+    phase = np.asarray(phase, dtype=np.int64) & 0xFFFF
+    return scale(cordic_table()[phase], gain, offset)
+
+def samples(num, inc=0x1000, gain=0x4000, offset=0):
+    # The first num samples after enabling the generator
+    return stim_sine(phases(inc, num), gain, offset)
+
+def ideal(phase, gain=0x4000, offset=0):
+    # Floating point sine with the same scaling, 2f16 like the output
+    phase = np.asarray(phase, dtype=np.float64)
+    return np.sin(phase / (1 << 16) * 2 * np.pi) * (np.asarray(gain) / (1 << 14)) + wrap(np.asarray(offset), 18) / (1 << 16)
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the bit-exact wfg_stim_sine model over all phases.')
+    parser.add_argument('--gains', type=lambda x: int(x, 0), nargs='+', help='gain values, all of 0 to 0x7FFF if not set')
+    parser.add_argument('--offsets', type=lambda x: int(x, 0), nargs='+', default=[0], help='offset values')
+    parser.add_argument('--step', type=lambda x: int(x, 0), default=1, help='step of the gain sweep')
+
+    args = parser.parse_args()
+
+    gains = np.array(args.gains if args.gains != None else range(0, 0x8000, args.step), dtype=np.int64)
+    phase = np.arange(1 << 16, dtype=np.int64)
+
+    print("{:>8} {:>8} {:>12} {:>12} {:>10}".format("offset", "gain", "mean abs", "max abs", "saturated"))
+
+    for offset in args.offsets:
+        for gain in gains:
+            output = stim_sine(phase, gain, offset)
+            error = np.abs(output / (1 << 16) - ideal(phase, gain, offset))
+            saturated = np.count_nonzero((output == (1 << 17) - 1) | (output == -(1 << 17)))
+
+            print("{:>8} {:>8} {:>12.3e} {:>12.3e} {:>10}".format(hex(offset), hex(gain), error.mean(), error.max(), saturated))
+
+if __name__ == "__main__":
+    main()
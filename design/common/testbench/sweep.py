@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Runs the option combinations of a bench like TestFactory, one test each with its own clock and reset,
+# or with SWEEP=1 as segments of a single test which sets up once and only reprograms the DUT in between
+
+import os
+import json
+import inspect
+import itertools
+import cocotb
+from cocotb.utils import get_sim_time
+
+class Testbench:
+    # Handed from setup to every segment, the DUT and the bus models as attributes
+    def __init__(self, dut, **handles):
+        self.dut = dut
+        self.__dict__.update(handles)
+
+def add_test(module, name, function, **options):
+    async def test(dut):
+        await function(dut, **options)
+
+    test.__name__ = name
+    test.__qualname__ = name
+    test.__module__ = module.__name__
+    test.__doc__ = ", ".join("{}={}".format(option, value) for (option, value) in options.items())
+    setattr(module, name, cocotb.test()(test))
+
+class SweepFactory:
+    def __init__(self, segment, setup):
+        # setup(dut) returns the testbench, segment(tb, **options) configures the DUT and checks it
+        self.segment = segment
+        self.setup = setup
+        self.options = {}
+        self.sweep = os.environ.get("SWEEP", "0") not in ("", "0")
+
+    def add_option(self, name, values):
+        self.options[name] = list(values)
+
+    def combinations(self):
+        # Same order and numbering as TestFactory
+        return [dict(zip(self.options, values)) for values in itertools.product(*self.options.values())]
+
+    def generate_tests(self):
+        module = inspect.getmodule(inspect.stack()[1][0])
+        name = self.segment.__name__
+
+        if self.sweep:
+            add_test(module, "{}_sweep".format(name), self.run_sweep)
+        else:
+            for (index, options) in enumerate(self.combinations()):
+                add_test(module, "{}_{:03d}".format(name, index + 1), self.run_single, **options)
+
+    async def run_single(self, dut, **options):
+        tb = await self.setup(dut)
+        await self.segment(tb, **options)
+
+    async def run_sweep(self, dut):
+        tb = await self.setup(dut)
+        combinations = self.combinations()
+        results = []
+
+        for (index, options) in enumerate(combinations):
+            description = ", ".join("{}={}".format(option, value) for (option, value) in options.items())
+            start = get_sim_time("ns")
+
+            # A failing configuration is reported, the next one reprograms the DUT anyway
+            try:
+                await self.segment(tb, **options)
+                error = None
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+
+            results.append({"index" : index + 1, "options" : options, "passed" : error is None, "error" : error,
+                            "sim_time_ns" : get_sim_time("ns") - start})
+
+            if error is None:
+                dut._log.info("Configuration {} of {} passed: {}".format(index + 1, len(combinations), description))
+            else:
+                dut._log.error("Configuration {} of {} failed: {}\n{}".format(index + 1, len(combinations), description, error))
+
+        results_file = os.environ.get("SWEEP_RESULTS", "{}_sweep.json".format(self.segment.__name__))
+        with open(results_file, "w") as f:
+            json.dump(results, f, indent=4, default=str)
+
+        failed = [result["index"] for result in results if not result["passed"]]
+        dut._log.info("{} of {} configurations passed, see {}".format(len(results) - len(failed), len(results), results_file))
+
+        assert not failed, "Configurations {} failed".format(", ".join(str(index) for index in failed))
@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Checks the sync and subcycle pulses of wfg_core and wfg_subcore from the time stamps of their edges.
+# Python only wakes up at the edges of the pulses, never per clock, so the full 8-bit sync and
+# 16-bit subcycle ranges can be covered.
+
+import os
+import cocotb
+import numpy as np
+from cocotb.triggers import RisingEdge, FallingEdge, with_timeout
+from cocotb.utils import get_sim_time, get_time_from_sim_steps
+
+def full_range():
+    # FULL_RANGE=1 adds the largest sync and subcycle counts, one sync period is then 2 * 256 * 65536 clocks
+    return os.environ.get("FULL_RANGE", "0") not in ("", "0")
+
+async def clock_period(clk):
+    # Period of a running clock in simulator steps
+    await RisingEdge(clk)
+    start = get_sim_time()
+    await RisingEdge(clk)
+    return get_sim_time() - start
+
+async def pulse_times(signal, count):
+    # Start and end of the next count pulses
+    starts = np.zeros(count, dtype=np.int64)
+    ends = np.zeros(count, dtype=np.int64)
+
+    for index in range(count):
+        await RisingEdge(signal)
+        starts[index] = get_sim_time()
+        await FallingEdge(signal)
+        ends[index] = get_sim_time()
+
+    return (starts, ends)
+
+def check_pulses(name, starts, ends, period, pulse_period):
+    # Every pulse is one clock long and follows the previous one after pulse_period
+    widths = ends - starts
+    wrong = np.flatnonzero(widths != period)
+    assert len(wrong) == 0, "{} pulse {} was high for {} steps instead of one clock of {} steps".format(
+        name, wrong[0], widths[wrong[0]], period)
+
+    gaps = np.diff(starts)
+    wrong = np.flatnonzero(gaps != pulse_period)
+    assert len(wrong) == 0, "{} pulse {} came {} steps after the previous one, expected {}".format(
+        name, wrong[0] + 1, gaps[wrong[0]], pulse_period)
+
+async def check_sync(dut, clk, sync, subcycle, sync_count, subcycle_count, periods=1):
+    # Checks the given number of sync periods from the next sync pulse on, times are in simulator steps
+    period = await clock_period(clk)
+    subcycle_period = 2 * (subcycle_count + 1) * period
+    sync_period = (sync_count + 1) * subcycle_period
+
+    async def collect():
+        # Both are collected from the end of a sync pulse on, every (sync_count + 1)th subcycle pulse comes with a sync pulse
+        await FallingEdge(sync)
+        subcycles = cocotb.start_soon(pulse_times(subcycle, (periods + 1) * (sync_count + 1)))
+        syncs = cocotb.start_soon(pulse_times(sync, periods + 1))
+        return (await syncs, await subcycles)
+
+    # The first sync comes within one period of the enable, a stuck output would hang the test
+    timeout = (periods + 3) * sync_period + 100 * period
+    ((sync_starts, sync_ends), (subcycle_starts, subcycle_ends)) = await with_timeout(collect(), timeout, "step")
+
+    check_pulses(sync._name, sync_starts, sync_ends, period, sync_period)
+    check_pulses(subcycle._name, subcycle_starts, subcycle_ends, period, subcycle_period)
+
+    assert np.array_equal(subcycle_starts[sync_count::sync_count + 1], sync_starts), \
+        "{} pulses are not aligned to every {}th {} pulse".format(sync._name, sync_count + 1, subcycle._name)
+
+    dut._log.info("{} sync and {} subcycle pulses checked, sync every {} ns, subcycle every {} ns".format(len(sync_starts),
+                  len(subcycle_starts), get_time_from_sim_steps(sync_period, "ns"), get_time_from_sim_steps(subcycle_period, "ns")))
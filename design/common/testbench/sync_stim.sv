@@ -0,0 +1,48 @@
+// SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+// SPDX-License-Identifier: Apache-2.0
+
+// Sync and subcycle pulses for the driver benches, so Python does not drive them every clock.
+// Python writes subcycle_clocks and sync_subcycles once, the pulses stay low while sync_subcycles is 0.
+
+`default_nettype none
+module sync_stim (
+    input wire clk,   // I; System clock
+    input wire rst_n, // I; Active low reset
+
+    output wire       sync_o,         // O; Sync pulse, with the last subcycle pulse of a period
+    output wire       subcycle_o,     // O; Subcycle pulse
+    output wire [7:0] subcycle_cnt_o  // O; Subcycle of the sync period
+);
+
+    // Written from Python
+    logic [15:0] subcycle_clocks;  // Clocks per subcycle
+    logic [ 7:0] sync_subcycles;   // Subcycles per sync period, 0 disables the pulses
+
+    logic [15:0] clock_cnt;     // Clock of the subcycle
+    logic [ 7:0] subcycle_cnt;  // Subcycle of the sync period
+
+    initial begin
+        subcycle_clocks = 16'd1;
+        sync_subcycles  = 8'd0;
+    end
+
+    always_ff @(posedge clk or negedge rst_n) begin
+        if (!rst_n) begin
+            clock_cnt    <= '0;
+            subcycle_cnt <= '0;
+        end else if (sync_subcycles == 0) begin
+            clock_cnt    <= '0;
+            subcycle_cnt <= '0;
+        end else if (subcycle_o) begin
+            clock_cnt    <= '0;
+            subcycle_cnt <= sync_o ? '0 : subcycle_cnt + 1;
+        end else begin
+            clock_cnt <= clock_cnt + 1;
+        end
+    end
+
+    assign subcycle_o     = (sync_subcycles != 0) && (clock_cnt >= subcycle_clocks - 1);
+    assign sync_o         = subcycle_o && (subcycle_cnt >= sync_subcycles - 1);
+    assign subcycle_cnt_o = subcycle_cnt;
+endmodule
+`default_nettype wire
@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Listed first in MODULE by telemetry.mk: records wall time, sim time, simulated ns per second,
+# the wakeups of Python by simulator triggers and the peak RSS of every test to TELEMETRY_FILE.
+# The file is written again after each test, so it is complete up to a test that crashed the simulator.
+
+import os
+import json
+import time
+import pathlib
+import resource
+from cocotb.regression import RegressionManager
+from cocotb.scheduler import Scheduler
+
+TELEMETRY_FILE = os.environ.get("TELEMETRY_FILE", "telemetry.json")
+
+# The simulator runs in design/<bench>/sim
+run = {"bench" : pathlib.Path.cwd().parent.name, "toplevel" : os.environ.get("TOPLEVEL", ""),
+       "simulator" : os.environ.get("SIM", ""), "testcase" : os.environ.get("TESTCASE", ""), "start" : time.time(), "tests" : []}
+
+wakeups = 0
+
+def peak_rss_mb():
+    # Peak resident memory of the simulator process so far, ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+react = Scheduler._react
+
+def count_react(self, trigger):
+    # Every call is a trigger of the simulator handing control to Python
+    global wakeups
+    wakeups += 1
+    return react(self, trigger)
+
+record_result = RegressionManager._record_result
+
+def record_telemetry(self, test, outcome, wall_time_s, sim_time_ns):
+    global wakeups
+    (failures, skipped) = (self.failures, self.skipped)
+    record_result(self, test, outcome, wall_time_s, sim_time_ns)
+
+    status = "skipped" if self.skipped > skipped else "failed" if self.failures > failures else "passed"
+    run["tests"].append({"name" : test.__qualname__, "status" : status,
+                         "wall_time_s" : wall_time_s, "sim_time_ns" : sim_time_ns,
+                         "sim_ns_per_s" : sim_time_ns / wall_time_s if wall_time_s > 0 else 0.0,
+                         "wakeups" : wakeups, "peak_rss_mb" : peak_rss_mb()})
+    wakeups = 0
+
+    with open(TELEMETRY_FILE, "w") as f:
+        json.dump(run, f, indent=4)
+
+Scheduler._react = count_react
+RegressionManager._record_result = record_telemetry
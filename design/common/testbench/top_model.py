@@ -0,0 +1,410 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Cycle exact model of wfg_top, configured through the same register maps as the RTL
+# Data only moves at sync pulses, so the model jumps from one sync pulse to the next instead of stepping the clock
+
+import abc
+import argparse
+import time
+import numpy as np
+from wfg_registers import PERIPHERALS, Core, Subcore, Interconnect, StimSine, StimMem, DriveSpi, DrivePat
+import stim_sine_model
+import drive_pat_model
+
+# Cycles from the first ST_IDLE cycle until ST_DONE is reached
+SINE_LATENCY = 20
+MEM_LATENCY = 3
+
+# States of wfg_drive_spi
+SPI_IDLE = 0
+SPI_SEND_DATA = 1
+SPI_LAST_BIT = 2
+
+def read_hex(path, size=1 << 10):
+    # Memory image as loaded by $readmemh in the testbenches, missing entries are zero
+    memory = np.zeros(size, dtype=np.uint32)
+    with open(path) as f:
+        words = [int(line.split("//")[0], 16) for line in f if line.split("//")[0].strip()]
+    memory[:len(words)] = words[:size]
+    return memory
+
+def sync_cycles(enable, sync, subcycle, cycles):
+    # Cycles with a sync pulse of wfg_core, the core is enabled from cycle enable on
+    return np.arange(enable + 1, cycles, 2 * (sync + 1) * (subcycle + 1), dtype=np.int64)
+
+def subcycle_cycles(enable, subcycle, cycles):
+    # Cycles with a subcycle pulse of wfg_core
+    return np.arange(enable + 1, cycles, 2 * (subcycle + 1), dtype=np.int64)
+
+def mem_scale(memory, gain):
+    # dsp_scale_sn_us of wfg_stim_mem for every memory entry, returns wfg_axis_tdata_o
+    data = np.asarray(memory, dtype=np.uint32).astype(np.int32).astype(np.int64)
+    product = data * int(gain & 0xFFFF)
+
+    # The product fits into 32 bits if bits 48 to 31 are all equal
+    high = product >> 31
+    result = np.where(high == 0, product, np.where(high == -1, product, np.where(product < 0, -(1 << 31), (1 << 31) - 1)))
+    return result & 0xFFFFFFFF
+
+def spi_frame(div, dff, cpol, lsbfirst, sspol):
+    # Pins of wfg_drive_spi for one word, index 0 is the cycle with the sync pulse that starts the frame
+    # sdo is given as the bit of the word driven out, -1 for zero
+    # Returns sclk, cs_n, the bits and the number of cycles until the next word can be started
+    bits = 8 * (dff + 1) - 1
+    idle = (cpol, 1 - sspol, -1)
+
+    sclk = [idle[0], idle[0]]
+    cs_n = [idle[1], idle[1]]
+    sdo = [idle[2], idle[2]]
+
+    # Registers in the first cycle of ST_SEND_DATA
+    state = SPI_SEND_DATA
+    (counter, current_bit, spi_clk, spi_cs, shifts, data) = (div, bits, 0, 1, 0, True)
+    cycle = 1
+
+    while state != SPI_IDLE:
+        # The pins follow the registers one cycle later
+        sclk.append(spi_clk ^ cpol)
+        cs_n.append(spi_cs if sspol else 1 - spi_cs)
+        bit = shifts if lsbfirst else bits - shifts
+        sdo.append(bit if data and 0 <= bit < 32 else -1)
+
+        next_state = state
+        if state == SPI_SEND_DATA and counter == 0 and current_bit == 0 and spi_clk:
+            next_state = SPI_LAST_BIT
+        elif state == SPI_LAST_BIT and counter == 0:
+            next_state = SPI_IDLE
+
+        if next_state == SPI_SEND_DATA:
+            counter = (counter - 1) & 0xFF
+            if counter == 0xFF:
+                counter = div
+                if spi_clk:
+                    current_bit -= 1
+                    shifts += 1
+                spi_clk ^= 1
+        elif next_state == SPI_LAST_BIT:
+            counter = div if state != SPI_LAST_BIT else counter - 1
+            (spi_clk, data) = (0, False)
+        else:
+            (spi_clk, spi_cs, data) = (0, 0, False)
+
+        state = next_state
+        cycle += 1
+
+    return (np.array(sclk, dtype=np.uint8), np.array(cs_n, dtype=np.uint8), np.array(sdo, dtype=np.int8), cycle)
+
+class Stimulus(abc.ABC):
+    # Handshake of wfg_stim_sine and wfg_stim_mem: valid is high from the cycle after ST_DONE is reached
+    # until the cycle after tready was seen in ST_DONE, the next sample is ready latency cycles after ST_IDLE
+    latency = 0
+
+    def __init__(self, enable):
+        self.done = None if enable is None else enable + self.latency
+        self.data = self.sample()
+        self.last = None
+        self.beats = []
+
+    @abc.abstractmethod
+    def sample(self):
+        # wfg_axis_tdata_o of the next sample
+        pass
+
+    def output(self, cycle):
+        # wfg_axis_tdata_o if wfg_axis_tvalid_o is high in the given cycle, else None
+        if self.done is not None and cycle > self.done:
+            return self.data
+        if self.last is not None and cycle <= self.last[1]:
+            return self.last[0]
+        return None
+
+    def ready(self, cycle):
+        # tready is high in the given cycle
+        if self.done is None or cycle < self.done:
+            return
+
+        # A sample is consumed even if tready comes in the first ST_DONE cycle, before valid went high
+        self.beats.append((cycle, self.data, cycle > self.done))
+        self.last = (self.data, cycle + 1)
+        self.data = self.sample()
+        self.done = cycle + 1 + self.latency
+
+class SineStimulus(Stimulus):
+    latency = SINE_LATENCY
+
+    def __init__(self, inc, gain, offset, enable):
+        self.table = (stim_sine_model.stim_sine(np.arange(1 << 16), gain, offset) & 0xFFFFFFFF).tolist()
+        self.inc = inc
+        self.phase = 0
+        super().__init__(enable)
+
+    def sample(self):
+        data = self.table[self.phase]
+        self.phase = (self.phase + self.inc) & 0xFFFF
+        return data
+
+class MemStimulus(Stimulus):
+    latency = MEM_LATENCY
+
+    def __init__(self, memory, start, end, inc, gain, enable):
+        self.table = mem_scale(memory, gain).tolist()
+        (self.start, self.end, self.inc) = (start, end, inc)
+        self.address = start
+        super().__init__(enable)
+
+    def sample(self):
+        data = self.table[self.address & (len(self.table) - 1)]
+
+        # cur_address + inc is a 16 bit sum in the RTL
+        address = (self.address + self.inc) & 0xFFFF
+        self.address = self.start if address > self.end else address
+        return data
+
+class TopModel:
+    def __init__(self, memory=None):
+        # Register images by wishbone address, all registers start with their reset value
+        self.memory = np.zeros(1 << 10, dtype=np.uint32) if memory is None else np.asarray(memory, dtype=np.uint32)
+        self.words = {peripheral.address(register) : register.reset
+                      for peripheral in PERIPHERALS for register in peripheral.registers}
+
+    def write(self, address, word):
+        if address not in self.words:
+            raise KeyError("No register at address 0x{:X}".format(address))
+        self.words[address] = int(word)
+        return self
+
+    def apply(self, writes):
+        # Writes as collected by WishboneConfig with top=True
+        for write in writes:
+            self.write(write[0], write[1])
+        return self
+
+    def set(self, peripheral, register, value=None, **fields):
+        if isinstance(register, str):
+            register = peripheral.register(register)
+        return self.write(peripheral.address(register), register.encode(**fields) if value is None else value)
+
+    def configure(self, peripheral, **registers):
+        # Same arguments as WishboneConfig.configure
+        for (name, fields) in registers.items():
+            if isinstance(fields, dict):
+                self.set(peripheral, name, **fields)
+            else:
+                self.set(peripheral, name, fields)
+        return self
+
+    def fields(self, peripheral, register):
+        return register.decode(self.words[peripheral.address(register)])
+
+    def run(self, cycles, enable=None):
+        # Simulates cycles clock cycles, enable gives the cycle each peripheral sees its CTRL.EN,
+        # the other registers keep their value from cycle 0 on
+        enable = dict(enable or {})
+        def enabled(peripheral):
+            return enable.get(peripheral, 0) if self.fields(peripheral, peripheral.CTRL)["EN"] else None
+
+        self.cycles = cycles
+
+        # Sync pulses of the core and the subcore
+        self.syncs = []
+        self.core_cfg = []
+        for core in (Core, Subcore):
+            cfg = self.fields(core, core.CFG)
+            core_enable = enabled(core)
+            self.core_cfg.append(cfg)
+            self.syncs.append(np.empty(0, dtype=np.int64) if core_enable is None else
+                              sync_cycles(core_enable, cfg["SYNC"], cfg["SUBCYCLE"], cycles))
+
+        def value(peripheral, register):
+            return self.fields(peripheral, register)["VAL"]
+
+        mem = self.fields(StimMem, StimMem.CFG)
+        self.stimuli = [SineStimulus(value(StimSine, StimSine.INC), value(StimSine, StimSine.GAIN),
+                                     value(StimSine, StimSine.OFFSET), enabled(StimSine)),
+                        MemStimulus(self.memory, value(StimMem, StimMem.START), value(StimMem, StimMem.END),
+                                    mem["INC"], mem["GAIN"], enabled(StimMem))]
+
+        select = [self.fields(Interconnect, Interconnect.DRIVER0)["SELECT"],
+                  self.fields(Interconnect, Interconnect.DRIVER1)["SELECT"]]
+
+        # Which drivers have to be ready for a stimulus to see tready
+        readers = [[driver for driver in (0, 1) if select[driver] == stimulus] for stimulus in (0, 1)]
+
+        spi = self.fields(DriveSpi, DriveSpi.CFG)
+        self.spi_cfg = spi
+        self.spi_template = spi_frame(self.fields(DriveSpi, DriveSpi.CLKCFG)["DIV"], spi["DFF"], spi["CPOL"],
+                                      spi["LSBFIRST"], spi["SSPOL"])
+        spi_length = self.spi_template[3]
+        spi_enable = enabled(DriveSpi)
+        spi_free = 0
+
+        pat = self.fields(DrivePat, DrivePat.CFG)
+        self.pat_cfg = pat
+
+        # Every cycle with a sync pulse, flagged with the drivers that see it
+        spi_sync = self.syncs[spi["CORE_SEL"]]
+        pat_sync = self.syncs[pat["CORE_SEL"]]
+        events = np.union1d(spi_sync, pat_sync)
+        spi_flags = np.isin(events, spi_sync).tolist()
+        pat_flags = np.isin(events, pat_sync).tolist()
+
+        spi_frames = []
+        pat_words = []
+        pat_word = 0
+
+        for (cycle, spi_flag, pat_flag) in zip(events.tolist(), spi_flags, pat_flags):
+            ready = [False, False]
+
+            if spi_flag:
+                data = self.stimuli[select[0]].output(cycle) if select[0] < 2 else None
+                if data is not None and spi_enable is not None and cycle >= max(spi_free, spi_enable):
+                    spi_frames.append((cycle, data))
+                    spi_free = cycle + spi_length
+                    ready[0] = True
+
+            if pat_flag:
+                data = self.stimuli[select[1]].output(cycle) if select[1] < 2 else None
+                if data is not None:
+                    pat_word = data
+                pat_words.append((cycle, pat_word))
+                ready[1] = True
+
+            # tready of the drivers is registered, the stimuli see it in the next cycle
+            for (stimulus, drivers) in zip(self.stimuli, readers):
+                if drivers and all(ready[driver] for driver in drivers):
+                    stimulus.ready(cycle + 1)
+
+        # Words are stored as sent, the bits above the data frame format are not on the wire
+        mask = (1 << (8 * (spi["DFF"] + 1))) - 1
+        self.spi_cycles = np.array([frame[0] for frame in spi_frames], dtype=np.int64)
+        self.spi_words = np.array([frame[1] & mask for frame in spi_frames], dtype=np.uint32)
+        self.pat_syncs = np.array([word[0] for word in pat_words], dtype=np.int64)
+        self.pat_words = np.array([word[1] for word in pat_words], dtype=np.uint32)
+        self.pat_periods = self.pat_output_periods()
+        return self
+
+    def beats(self, stimulus):
+        # Samples consumed from a stimulus as cycle, value and whether valid was high in that cycle
+        beats = self.stimuli[stimulus].beats
+        return {"cycle" : np.array([beat[0] for beat in beats], dtype=np.int64),
+                "value" : np.array([beat[1] for beat in beats], dtype=np.uint32),
+                "valid" : np.array([beat[2] for beat in beats], dtype=bool)}
+
+    def pat_output_periods(self):
+        # pat_dout_o at the start of each subcycle count, one row per sync period plus one after the last word
+        pat = self.pat_cfg
+        sync = self.core_cfg[pat["CORE_SEL"]]["SYNC"]
+        en = self.fields(DrivePat, DrivePat.CTRL)["EN"]
+        low = self.fields(DrivePat, DrivePat.PATSEL0)["LOW"]
+        high = self.fields(DrivePat, DrivePat.PATSEL1)["HIGH"]
+
+        # Before the first sync the subcycle count stays at zero and axis_data_ff is zero
+        initial = int(drive_pat_model.step(0, np.uint32(0), np.uint32(0), np.uint32(en), np.uint32(low),
+                                           np.uint32(high), pat["BEGIN"], pat["END"]))
+        words = np.append(self.pat_words, self.pat_words[-1:] if len(self.pat_words) else [0])
+
+        (value, _) = drive_pat_model.drive_pat(words, en, low, high, pat["BEGIN"], pat["END"], sync + 1, initial)
+        return (initial, value)
+
+    def pat_output(self, start, stop):
+        # pat_dout_o of the cycles start to stop
+        cycle = np.arange(start, stop, dtype=np.int64)
+        subcycle = self.core_cfg[self.pat_cfg["CORE_SEL"]]["SUBCYCLE"]
+        (initial, value) = self.pat_periods
+        flat = value.reshape(-1)
+        subcycles = value.shape[1]
+        length = 2 * (subcycle + 1)
+
+        # Each subcycle count lasts length cycles, data_ff follows it one cycle later
+        period = np.searchsorted(self.pat_syncs, cycle - 1, side="right") - 1
+        offset = cycle - 1 - self.pat_syncs[np.maximum(period, 0)] if len(self.pat_syncs) else cycle
+        index = period * subcycles + offset // length + (offset % length != 0)
+        index = np.minimum(index, len(flat) - 1)
+
+        return np.where(period < 0, initial, flat[np.maximum(index, 0)]).astype(np.uint32)
+
+    def spi_pins(self, start, stop):
+        # sclk, cs_n and sdo of the cycles start to stop
+        cycle = np.arange(start, stop, dtype=np.int64)
+        (sclk, cs_n, sdo, _) = self.spi_template
+
+        frame = np.searchsorted(self.spi_cycles, cycle, side="right") - 1
+        offset = cycle - self.spi_cycles[np.maximum(frame, 0)] if len(self.spi_cycles) else cycle
+        inside = (frame >= 0) & (offset < len(sclk))
+        offset = np.where(inside, offset, 0)
+
+        bit = sdo[offset].astype(np.int64)
+        words = self.spi_words[np.maximum(frame, 0)].astype(np.int64) if len(self.spi_words) else np.zeros_like(cycle)
+        data = np.where(inside & (bit >= 0), (words >> np.maximum(bit, 0)) & 1, 0)
+
+        return {"sclk" : np.where(inside, sclk[offset], sclk[0]).astype(np.uint8),
+                "cs_n" : np.where(inside, cs_n[offset], cs_n[0]).astype(np.uint8),
+                "sdo" : data.astype(np.uint8)}
+
+    def save(self, path):
+        # Reference streams for the testbenches
+        arrays = {"core_sync" : self.syncs[0], "subcore_sync" : self.syncs[1],
+                  "spi_cycle" : self.spi_cycles, "spi_word" : self.spi_words,
+                  "pat_sync" : self.pat_syncs, "pat_word" : self.pat_words}
+        for (stimulus, name) in enumerate(("sine", "mem")):
+            for (column, values) in self.beats(stimulus).items():
+                arrays["{}_{}".format(name, column)] = values
+        np.savez_compressed(path, **arrays)
+
+def configure_default(model):
+    # The configuration of test_wfg_top
+    model.configure(Core, cfg=dict(sync=16, subcycle=16), ctrl=dict(en=1))
+    model.configure(Subcore, cfg=dict(sync=32, subcycle=16), ctrl=dict(en=1))
+    model.configure(Interconnect, driver0=dict(select=0), driver1=dict(select=1), ctrl=dict(en=1))
+    model.configure(StimSine, inc=dict(val=0x1000), gain=dict(val=0x4000), offset=dict(val=0), ctrl=dict(en=1))
+    model.configure(StimMem, start=dict(val=0), end=dict(val=0xF), cfg=dict(gain=1, inc=1), ctrl=dict(en=1))
+    model.configure(DriveSpi, clkcfg=dict(div=3), cfg=dict(dff=3), ctrl=dict(en=1))
+    model.configure(DrivePat, cfg=dict(begin=0, end=8), patsel0=dict(low=0xFFFFFFFF), patsel1=dict(high=0xFFFFFFFF),
+                    ctrl=dict(en=0xFFFFFFFF))
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the cycle exact model of wfg_top")
+    parser.add_argument("-c", "--cycles", type=int, default=1000000, help="number of clock cycles")
+    parser.add_argument("-s", "--set", action="append", default=[], metavar="PERIPHERAL.REGISTER.FIELD=VALUE",
+                        help="change a register field of the test_wfg_top configuration, e.g. DriveSpi.CLKCFG.DIV=7")
+    parser.add_argument("-m", "--memory", help="hex file of the memory of wfg_stim_mem")
+    parser.add_argument("-o", "--output", help="save the reference streams to this .npz file")
+    args = parser.parse_args()
+
+    model = configure_default(TopModel(read_hex(args.memory) if args.memory else None))
+    peripherals = {peripheral.name.lower() : peripheral for peripheral in PERIPHERALS}
+
+    for assignment in args.set:
+        try:
+            (name, value) = assignment.split("=")
+            (peripheral, register, field) = name.split(".")
+            peripheral = peripherals[peripheral.lower()]
+            register = peripheral.register(register)
+            field = register.field(field)
+
+            word = model.words[peripheral.address(register)]
+            model.set(peripheral, register, (word & ~field.mask) | field.encode(int(value, 0)))
+        except (ValueError, KeyError) as e:
+            print("Error: invalid register setting {}: {}".format(assignment, e))
+            exit(1)
+
+    start = time.time()
+    model.run(args.cycles)
+    elapsed = time.time() - start
+
+    print("Simulated {} cycles in {:.3f} s, {:.0f} cycles/s".format(args.cycles, elapsed, args.cycles / max(elapsed, 1e-9)))
+    print("Sync pulses: core {}, subcore {}".format(len(model.syncs[0]), len(model.syncs[1])))
+    for (stimulus, name) in enumerate(("stim_sine", "stim_mem")):
+        beats = model.beats(stimulus)
+        print("{}: {} samples consumed, {} of them without valid".format(name, len(beats["cycle"]), np.count_nonzero(~beats["valid"])))
+    print("drive_spi: {} words, {} cycles per frame".format(len(model.spi_words), model.spi_template[3]))
+    print("drive_pat: {} sync periods".format(len(model.pat_words)))
+
+    if args.output:
+        model.save(args.output)
+        print("Reference streams saved to {}".format(args.output))
+
+if __name__ == "__main__":
+    main()
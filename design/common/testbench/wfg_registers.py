@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+# Register model of all peripherals, generated from design/*/data/*_reg.json with "make templates"
+
+from regmodel import Field, Register, Peripheral
+
+class Core(Peripheral):
+    base = 0x1
+    #marker_template_start
+    #data: ../../wfg_core/data/wfg_core_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Core configuration register
+    class CFG(Register):
+        __slots__ = ()
+        address = "4'h4"
+        SUBCYCLE = Field(23, 8, "0", "rw")
+        SYNC = Field(7, 0, "0", "rw")
+    # Core control register
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    #marker_template_end
+
+class Subcore(Peripheral):
+    base = 0x2
+    #marker_template_start
+    #data: ../../wfg_subcore/data/wfg_subcore_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Core configuration register
+    class CFG(Register):
+        __slots__ = ()
+        address = "4'h4"
+        SUBCYCLE = Field(23, 8, "0", "rw")
+        SYNC = Field(7, 0, "0", "rw")
+    # Core control register
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    #marker_template_end
+
+class Interconnect(Peripheral):
+    base = 0x3
+    #marker_template_start
+    #data: ../../wfg_interconnect/data/wfg_interconnect_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Control register for interconnect
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    # Driver configuration register
+    class DRIVER0(Register):
+        __slots__ = ()
+        address = "4'h4"
+        SELECT = Field(1, 0, "0", "rw")
+    # Driver configuration register
+    class DRIVER1(Register):
+        __slots__ = ()
+        address = "4'h8"
+        SELECT = Field(1, 0, "0", "rw")
+    #marker_template_end
+
+class StimSine(Peripheral):
+    base = 0x4
+    #marker_template_start
+    #data: ../../wfg_stim_sine/data/wfg_stim_sine_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Control register for sine wave generation unit
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    # Gain register
+    class GAIN(Register):
+        __slots__ = ()
+        address = "4'h8"
+        VAL = Field(15, 0, "16'h4000", "rw")
+    # Increment register
+    class INC(Register):
+        __slots__ = ()
+        address = "4'h4"
+        VAL = Field(15, 0, "16'h1000", "rw")
+    # Offset register
+    class OFFSET(Register):
+        __slots__ = ()
+        address = "4'hC"
+        VAL = Field(17, 0, "18'h0000", "rw")
+    #marker_template_end
+
+class StimMem(Peripheral):
+    base = 0x5
+    #marker_template_start
+    #data: ../../wfg_stim_mem/data/wfg_stim_mem_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Configuration register
+    class CFG(Register):
+        __slots__ = ()
+        address = "4'hC"
+        GAIN = Field(23, 8, "8'h01", "rw")
+        INC = Field(7, 0, "8'h01", "rw")
+    # Control register for memory unit
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    # End register
+    class END(Register):
+        __slots__ = ()
+        address = "4'h8"
+        VAL = Field(15, 0, "0", "rw")
+    # Start register
+    class START(Register):
+        __slots__ = ()
+        address = "4'h4"
+        VAL = Field(15, 0, "0", "rw")
+    #marker_template_end
+
+class DriveSpi(Peripheral):
+    base = 0x6
+    #marker_template_start
+    #data: ../../wfg_drive_spi/data/wfg_drive_spi_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # SPI configuration register
+    class CFG(Register):
+        __slots__ = ()
+        address = "4'h4"
+        CORE_SEL = Field(5, 5, "1'b0", "rw")
+        CPOL = Field(0, 0, "1'b0", "rw")
+        DFF = Field(3, 2, "2'b00", "rw")
+        LSBFIRST = Field(1, 1, "1'b0", "rw")
+        SSPOL = Field(4, 4, "1'b0", "rw")
+    # SPI clock configuration register
+    class CLKCFG(Register):
+        __slots__ = ()
+        address = "4'h8"
+        DIV = Field(7, 0, "0", "rw")
+    # Control register for SPI unit
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(0, 0, "1'b0", "rw")
+    #marker_template_end
+
+class DrivePat(Peripheral):
+    base = 0x7
+    #marker_template_start
+    #data: ../../wfg_drive_pat/data/wfg_drive_pat_reg.json
+    #template: python/register_model.template
+    #marker_template_code
+    # Pattern configuration register
+    class CFG(Register):
+        __slots__ = ()
+        address = "4'h4"
+        BEGIN = Field(7, 0, "0", "rw")
+        CORE_SEL = Field(16, 16, "1'b0", "rw")
+        END = Field(15, 8, "0", "rw")
+    # Control register for pattern unit
+    class CTRL(Register):
+        __slots__ = ()
+        address = "4'h0"
+        EN = Field(31, 0, "0", "rw")
+    # Low bits of PATSEL
+    class PATSEL0(Register):
+        __slots__ = ()
+        address = "4'h8"
+        LOW = Field(31, 0, "0", "rw")
+    # High bits of PATSEL
+    class PATSEL1(Register):
+        __slots__ = ()
+        address = "4'hC"
+        HIGH = Field(31, 0, "0", "rw")
+    #marker_template_end
+
+# Peripherals in the wishbone address map of wfg_top
+PERIPHERALS = (Core, Subcore, Interconnect, StimSine, StimMem, DriveSpi, DrivePat)
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+from cocotbext.wishbone.driver import WBOp
+
+class WishboneConfig:
+    # Collects register writes and sends them in a single wishbone cycle
+    def __init__(self, dut, wbs, top=True):
+        self.dut = dut
+        self.wbs = wbs
+        self.top = top
+        self.writes = []
+
+    def address(self, peripheral, register):
+        if self.top:
+            return peripheral.address(register)
+        return register.address
+
+    def set(self, peripheral, register, value=None, **fields):
+        # Either a raw word or fields, fields not given keep their reset value
+        if isinstance(register, str):
+            register = peripheral.register(register)
+
+        word = register.encode(**fields) if value is None else int(value)
+        self.writes.append((self.address(peripheral, register), int(word), register.mask,
+                            "{}.{}".format(peripheral.name, register.name)))
+        return self
+
+    def configure(self, peripheral, **registers):
+        # Registers are written in the order they are given, put the enable last
+        for (name, fields) in registers.items():
+            if isinstance(fields, dict):
+                self.set(peripheral, name, **fields)
+            else:
+                self.set(peripheral, name, fields)
+        return self
+
+    async def apply(self, readback=False):
+        # Readback reads all written registers at the end of the same cycle and checks them at once
+        writes = self.writes
+        self.writes = []
+
+        if not writes:
+            return []
+
+        ops = [WBOp(address, word) for (address, word, _, _) in writes]
+        if readback:
+            ops += [WBOp(address) for (address, _, _, _) in writes]
+
+        self.dut._log.info("Configure {} registers in one cycle: {}".format(len(writes),
+                           ", ".join("{}=0x{:X}".format(name, word) for (_, word, _, name) in writes)))
+
+        wbRes = await self.wbs.send_cycle(ops)
+
+        if readback:
+            # Only the last write to a register counts
+            expected = {}
+            for (address, word, mask, name) in writes:
+                expected[address] = (word, mask, name)
+
+            for ((address, _, _, _), result) in zip(writes, wbRes[len(writes):]):
+                (word, mask, name) = expected[address]
+                value = int(result.datrd)
+                assert (value & mask) == (word & mask), "Readback of {} is 0x{:X}, expected 0x{:X}".format(name, value & mask, word & mask)
+
+        return wbRes
@@ -10,10 +10,11 @@
 `endif
 
 module wfg_core_tb #(
-    parameter int BUSW = 32
+    parameter int BUSW = 32,
+    parameter int CLK_PERIOD = 10  // Clock period in ns
 ) (
     // Wishbone interface signals
-    input               io_wbs_clk,
+    output logic        io_wbs_clk,  // Generated here, a clock driven from Python wakes it every half period
     input               io_wbs_rst,
     input  [(BUSW-1):0] io_wbs_adr,
     input  [(BUSW-1):0] io_wbs_datwr,
@@ -31,6 +32,11 @@ module wfg_core_tb #(
     output wire       active_o                  // O; Active indication signal
 );
 
+    initial begin
+        io_wbs_clk = 1'b0;
+        forever #(CLK_PERIOD / 2.0) io_wbs_clk = ~io_wbs_clk;
+    end
+
     wfg_core_top wfg_core_top (
         .wb_clk_i (io_wbs_clk),
         .wb_rst_i (io_wbs_rst),
@@ -51,10 +57,12 @@ module wfg_core_tb #(
         .active_o(active_o)
     );
 
-    // Dump waves
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_core_tb.vcd");
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_core_tb.vcd";
+        $dumpfile(dumpfile);
         $dumpvars(0, wfg_core_tb);
     end
 `endif
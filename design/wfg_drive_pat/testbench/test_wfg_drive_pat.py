@@ -1,93 +1,107 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
 import random
+import itertools
+import numpy as np
 import cocotb
-import pdb
-from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles
-from cocotbext.wishbone.driver import WishboneMaster, WBOp
+from cocotb.triggers import Timer, Event
+from cocotb.utils import get_sim_time, get_sim_steps
+from cocotbext.wishbone.driver import WishboneMaster
 from cocotbext.axi import AxiStreamBus, AxiStreamSource
 from cocotb.triggers import RisingEdge, FallingEdge
-from cocotb_bus.monitors import Monitor
-from cocotb_bus.scoreboard import Scoreboard
 from cocotb.regression import TestFactory
+from wfg_registers import DrivePat
+from wishbone_config import WishboneConfig
+import drive_pat_model
+from capture import ChangeCapture
 
 ADDITIONAL_OUTPUT = False
 
 CHANNELS = 32
 SUBCYCLES_PER_SYNC = 24
 
-class OutputMonitor(Monitor):
-    def __init__(self, dut, name="",callback=None, event=None):
-        self.dut = dut
-        self.name = name
-        Monitor.__init__(self, callback, event)
-
-    async def _monitor_recv(self):
-        clkedge = RisingEdge(self.dut.io_wbs_clk)
-        while True:
-            await clkedge
-            output = self.dut.wfg_drive_pat_dout_o.value
-            self._recv(str(output))
 #========
 
-"""
-async def drive_sync(dut):
-    dut.wfg_wfg_pat_sync_i.value = 0
-    sync_cnt = 0
-    while True:
-        await RisingEdge(dut.io_wbs_clk)
-        if sync_cnt == CLK_PER_SYNC-1:
-            sync_cnt = 0
-            dut.wfg_wfg_pat_sync_i.value = 1
-        else:
-            sync_cnt = sync_cnt + 1
-            dut.wfg_wfg_pat_sync_i.value = 0
-"""
-
 async def reset(dut):
-    await ClockCycles(dut.io_wbs_clk, 1)
+    await RisingEdge(dut.io_wbs_clk)
     dut.io_wbs_rst.value = 1
-    await ClockCycles(dut.io_wbs_clk, 1)
+    await RisingEdge(dut.io_wbs_clk)
     dut.io_wbs_rst.value = 0
-    await ClockCycles(dut.io_wbs_clk, 1)
-
-async def set_register(dut, wbs, address, data):
-    dut._log.info(f"Set register {address} : {data}")
-
-    wbRes = await wbs.send_cycle([WBOp(address, data)])
-    
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
-
-async def configure(dut, wbs, en, pat, begin, end): # TODO
-    #begin = 9
-    #end = 16
-
-    #en = 7
-    #pat = [1,2]
-    #pat[0] = 3
-    #pat[1] = 1
-
-    await set_register(dut, wbs, 0x4, (begin & 0xFF) | ((end & 0xFF)<<8))
-    await set_register(dut, wbs, 0x8, pat[0])
-    await set_register(dut, wbs, 0xC, pat[1])
-    await set_register(dut, wbs, 0x0, en) # Enable PAT
-
-class MyScoreboard(Scoreboard):
-    def compare(self, got, exp, log, **_):
-        if got != exp and exp != 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx':
-            self.errors += 1
-            #log.error("Received transaction differed from expected output.")
-            log.warning("Received transaction differed from expected output.")
-            log.warning("Expected: {0!s}.\nReceived: {1!s}.".format(exp, got))
-            #if self._imm:
-            #  raise TestFailure("Received transaction differed from expected transaction.")
-        elif ADDITIONAL_OUTPUT:
-            log.info("Received transaction matches expected output.")
-            log.info("Expected: {0!s}.\nReceived: {1!s}.".format(exp, got))
+    await RisingEdge(dut.io_wbs_clk)
+
+async def configure(dut, wbs, en, pat, begin, end):
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(DrivePat, cfg=dict(begin=begin & 0xFF, end=end & 0xFF),
+                     patsel0=dict(low=pat[0]), patsel1=dict(high=pat[1]),
+                     ctrl=dict(en=en)) # Enable PAT
+    await config.apply()
+
+class PatScoreboard:
+    # Compares pat_dout_o with the model a chunk of periods at a time. The outputs are recorded on change,
+    # the expected words are produced lazily and done is set once the last expected word is checked.
+    def __init__(self, dut, expected, clk_period):
+        # clk_period in ns, the outputs are sampled at the falling clock edges
+        self.dut = dut
+        self.expected = expected
+        self.clk_period = clk_period
+        self.errors = 0
+        self.checked = 0
+        self.done = Event()
+        self.captures = [ChangeCapture(dut.wfg_drive_pat_dout_o), ChangeCapture(dut.wfg_drive_pat_dout_en_o)]
+        self._task = None
+
+    def start(self):
+        # Call at a rising clock edge, the first expected word belongs to the falling edge that follows
+        for capture in self.captures:
+            capture.start()
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        for capture in self.captures:
+            capture.stop()
+        if self._task is not None:
+            self._task.kill()
+
+    async def _run(self):
+        period = get_sim_steps(self.clk_period, "ns")
+        first_sample = get_sim_time() + period // 2
+
+        for (exp_value, exp_z_mask) in self.expected:
+            samples = first_sample + (self.checked + np.arange(len(exp_value))) * period
+
+            # Sleep until the last clock of the chunk has been sampled
+            await Timer(int(samples[-1]) + 1 - get_sim_time(), "step")
+
+            (got_value, got_z_mask) = (self._values(capture, samples) for capture in self.captures)
+            got_z_mask = ~got_z_mask & 0xFFFFFFFF
+            self._compare(got_value, got_z_mask, exp_value.astype(np.uint64), exp_z_mask.astype(np.uint64))
+            self.checked += len(exp_value)
+
+        self.done.set()
+
+    def _values(self, capture, samples):
+        # Value of the signal at each sample time, the capture must still hold the whole chunk
+        arrays = capture.arrays()
+        if arrays["time"][0] > samples[0]:
+            raise RuntimeError("{} changed too often, records were overwritten".format(capture.signal._name))
+        return arrays["value"][np.searchsorted(arrays["time"], samples, side="right") - 1]
+
+    def _compare(self, got_value, got_z_mask, exp_value, exp_z_mask):
+        # The value of channels at high impedance is ignored
+        mismatches = np.flatnonzero((got_z_mask != exp_z_mask) | ((got_value ^ exp_value) & ~exp_z_mask != 0))
+        self.errors += len(mismatches)
+
+        for index in mismatches[:4]:
+            self.dut._log.warning("Clock {} differed from expected output.".format(self.checked + index))
+            self.dut._log.warning("Expected: {0!s}.\nReceived: {1!s}.".format(
+                drive_pat_model.to_string(int(exp_value[index]), int(exp_z_mask[index])),
+                drive_pat_model.to_string(int(got_value[index]), int(got_z_mask[index]))))
+
+        if ADDITIONAL_OUTPUT:
+            self.dut._log.info("Clocks {} to {} checked, {} mismatches".format(self.checked, self.checked + len(got_value) - 1,
+                                                                              len(mismatches)))
 #========
 
 class Testbench(object):
@@ -95,103 +109,24 @@ class Testbench(object):
         self.dut = dut
         self.dut._log.info("Init TB...")
 
-        clock = Clock(dut.io_wbs_clk, 10, units="ns")  # Create a 10ns period clock on port clk
-        cocotb.fork(clock.start())  # Start the clock
-        cocotb.fork(self.drive_subcycles())  # count subcycles
-
-    async def drive_subcycles(self):
-        self.dut.wfg_core_subcycle_cnt_i.value = 0
-        self.dut.wfg_core_sync_i.value = 1
-        while True:
-            await RisingEdge(self.dut.io_wbs_clk)
-            subcycles = self.dut.wfg_core_subcycle_cnt_i.value
-            if subcycles == SUBCYCLES_PER_SYNC-2:
-                self.dut.wfg_core_subcycle_cnt_i.value = subcycles + 1
-                self.dut.wfg_core_sync_i.value = 1
-            elif subcycles == SUBCYCLES_PER_SYNC-1:
-                self.dut.wfg_core_subcycle_cnt_i.value = 0
-                self.dut.wfg_core_sync_i.value = 0
-            else:
-                self.dut.wfg_core_subcycle_cnt_i.value = subcycles + 1
-                self.dut.wfg_core_sync_i.value = 0
+        # Subcycle counter and sync pulses from sync_stim in the testbench, one subcycle per clock
+        dut.sync_stim.subcycle_clocks.value = 1
+        dut.sync_stim.sync_subcycles.value = SUBCYCLES_PER_SYNC
+
 #========
 
-def make_expected_output(dut, input, out_begin, out_end, pat_select_i, en_i):
-    expected_output = []
-
-    print(input)
-
-    byte = bin(input)[2:].rjust(CHANNELS, '0')[::-1]
-
-    print("byte")
-    print(byte)
-    print("en")
-    print(bin(en_i))    
-    
-    for i in range(SUBCYCLES_PER_SYNC):
-
-        next_output = ''
-        for j in range(CHANNELS):
-            pat_select = (pat_select_i[0]>>j & 1) | ((pat_select_i[1]>>j & 1)<<1)
-            en         = (en_i>>j) & 1
-            bit        = str((input>>j) & 1)
-            
-            print("i={}, j={}, en={}, pat={}, bit={}".format(i, j, en, pat_select, bit))
-
-            if en == 0:
-                next_output = 'z' + next_output
-            elif pat_select == 0: # RZ
-                if i >= out_end:
-                    next_output = '0' + next_output
-                elif i >= out_begin:
-                    next_output = bit + next_output
-                else:
-                    next_output = '0' + next_output
-            elif pat_select == 1: # RO
-                if i >= out_end:
-                    next_output = '1' + next_output
-                elif i >= out_begin:
-                    next_output = bit + next_output
-                else:
-                    next_output = '0' + next_output
-            elif pat_select == 2: # NRZ
-                if i >= out_end:
-                    next_output = bit + next_output
-                elif i >= out_begin:
-                    next_output = bit + next_output
-                else:
-                    next_output = '0' + next_output
-            elif pat_select == 3: # RC
-                if i >= out_end:
-                    if bit == '0':
-                        next_output = '1' + next_output
-                    else:
-                        next_output = '0' + next_output
-                elif i >= out_begin:
-                    next_output = bit + next_output
-                else:
-                    next_output = '0' + next_output
-            else:
-                dut._log.error('should not happen!')
-                
-            print(next_output)
-
-        expected_output.append(''.join(next_output))
-    
-    print()
-    
-    for j in reversed(range(CHANNELS)):
-        pat_select = (pat_select_i[0]>>j & 1) | ((pat_select_i[1]>>j & 1)<<1)
-        print(pat_select, end="")
-    print("")
-    
-    print(byte)
-    
-    for exp in expected_output:
-        print(exp)
-    
-    return expected_output
-    
+def make_expected_output(input, out_begin, out_end, pat_select_i, en_i, tail):
+    # One period with the reset data before the monitored period, then one period per input word,
+    # after the last word axis_data_ff keeps it for the tail periods
+    words = itertools.chain([0, 0], input, itertools.repeat(input[-1], tail))
+
+    chunks = drive_pat_model.stream(words, en_i, pat_select_i[0], pat_select_i[1], out_begin, out_end, SUBCYCLES_PER_SYNC)
+
+    # The period before the monitored one is left out
+    (value, z_mask) = next(chunks)
+    yield (value[SUBCYCLES_PER_SYNC:], z_mask[SUBCYCLES_PER_SYNC:])
+    yield from chunks
+
 @cocotb.coroutine
 async def run_test(dut, en=None, pat=None, begin=None, end=None, inputlen=None):
 
@@ -209,62 +144,51 @@ async def run_test(dut, en=None, pat=None, begin=None, end=None, inputlen=None):
     tb = Testbench(dut)
 
     input = [random.randint(0, 2**(CHANNELS-1)) for _ in range(inputlen)]
-    print(input)
-    
-    for byte in input:
-        expected_output = make_expected_output(dut, input=byte, out_begin=begin, out_end=end, pat_select_i=pat, en_i=en)
+    dut._log.info("Input: {}".format(input))
 
-        await reset(dut)
-        
-        # Wishbone Master
-        wbs = WishboneMaster(dut, "io_wbs", dut.io_wbs_clk,
-                                      width=32,   # size of data bus
-                                      timeout=10) # in clock cycle number
+    expected_output = make_expected_output(input, out_begin=begin, out_end=end, pat_select_i=pat, en_i=en, tail=2)
 
-        await configure(dut, wbs, en=en, pat=pat, begin=begin, end=end)
+    await reset(dut)
 
-        await FallingEdge(dut.wfg_core_sync_i) # TODO
-        
-        output_mon = OutputMonitor(dut)
-        
-        scoreboard = MyScoreboard(dut)
-        scoreboard.add_interface(output_mon, expected_output)
+    # Wishbone Master
+    wbs = WishboneMaster(dut, "io_wbs", dut.io_wbs_clk,
+                                  width=32,   # size of data bus
+                                  timeout=10) # in clock cycle number
 
-        print("Sending data")
-    
-        axis_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
-        for byte in input:
-            await axis_source.send([byte])
-            
-        await axis_source.send([0xFF])
-        await axis_source.send([0xFF])
+    await configure(dut, wbs, en=en, pat=pat, begin=begin, end=end)
 
-        print("Waiting for expected_output != []")
+    # Let one full period pass with the new configuration, then monitor from the start of the next one
+    await FallingEdge(dut.wfg_core_sync_i)
+    await FallingEdge(dut.wfg_core_sync_i)
 
-        while expected_output != []:
-            print(expected_output)
-            await ClockCycles(dut.io_wbs_clk, 1)
+    # The clock is generated in the testbench
+    scoreboard = PatScoreboard(dut, expected_output, int(dut.CLK_PERIOD.value)).start()
 
-        output_mon.kill()
+    # The first word is latched by the sync at the end of the monitored period
+    axis_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
+    for byte in input:
+        await axis_source.send([byte])
 
-        print("Result")
+    await scoreboard.done.wait()
+    scoreboard.stop()
 
-        raise scoreboard.result
+    dut._log.info("{} clocks checked".format(scoreboard.checked))
+    assert scoreboard.errors == 0, "{} clocks differed from the expected output".format(scoreboard.errors)
 
 
 factory = TestFactory(run_test)
 factory.add_option("en", [None])
 
-#pat = [None] + [sum(j * 2**i for i in range(0, 15, 2)) for j in range (0, 4)]
-pat = [None]
+# Random formats, then all channels RZ, RO, NRZ and RC
+pat = [None] + [list(drive_pat_model.patsel([j] * CHANNELS)) for j in range(4)]
 factory.add_option("pat", pat)
 
 #begin = [None, int.from_bytes(b'\x01\x01\x01\x01\x01\x01\x01\x01', byteorder='big')]
-begin = [None]
+begin = [None, 20]
 
 factory.add_option("begin", begin)
 
-end = [None]
+end = [None, 20]
 factory.add_option("end", end)
 
 inputlen = [None, 1]
@@ -12,10 +12,11 @@
 module wfg_drive_pat_tb #(
     parameter int BUSW = 32,
     parameter int AXIS_DATA_WIDTH = 32,
-    parameter int CHANNELS = 32
+    parameter int CHANNELS = 32,
+    parameter int CLK_PERIOD `VL_RD = 10  // Clock period in ns, read by the scoreboard
 ) (
     // Wishbone interface signals
-    input               io_wbs_clk,
+    output logic        io_wbs_clk,  // Generated here, a clock driven from Python wakes it every half period
     input               io_wbs_rst,
     input  [(BUSW-1):0] io_wbs_adr,
     input  [(BUSW-1):0] io_wbs_datwr,
@@ -25,9 +26,9 @@ module wfg_drive_pat_tb #(
     output              io_wbs_ack,
     input               io_wbs_cyc,
 
-    // Core synchronisation interface
-    input logic wfg_core_sync_i,
-    input logic [7:0] wfg_core_subcycle_cnt_i,
+    // Core synchronisation interface, generated by sync_stim
+    output wire       wfg_core_sync_i,
+    output wire [7:0] wfg_core_subcycle_cnt_i,
 
     // AXI-Stream interface
     output wire                        wfg_axis_tready,  // O; ready
@@ -40,6 +41,20 @@ module wfg_drive_pat_tb #(
     output wire [CHANNELS-1:0] wfg_drive_pat_dout_en_o  // O; output enabled
 );
 
+    initial begin
+        io_wbs_clk = 1'b0;
+        forever #(CLK_PERIOD / 2.0) io_wbs_clk = ~io_wbs_clk;
+    end
+
+    // Sync pulses and subcycle counter, configured once from Python
+    sync_stim sync_stim (
+        .clk           (io_wbs_clk),
+        .rst_n         (!io_wbs_rst),
+        .sync_o        (wfg_core_sync_i),
+        .subcycle_o    (),
+        .subcycle_cnt_o(wfg_core_subcycle_cnt_i)
+    );
+
     wfg_drive_pat_top #(
         .BUSW(BUSW),
         .CHANNELS(CHANNELS),
@@ -68,10 +83,12 @@ module wfg_drive_pat_tb #(
         .pat_dout_en_o(wfg_drive_pat_dout_en_o)
     );
 
-    // Dump waves
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_drive_pat_tb.vcd");
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_drive_pat_tb.vcd";
+        $dumpfile(dumpfile);
         $dumpvars(0, wfg_drive_pat_tb);
     end
 `endif
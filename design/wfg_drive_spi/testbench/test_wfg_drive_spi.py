@@ -3,78 +3,34 @@
 
 import os
 import cocotb
-from cocotb.clock import Clock
-from cocotb.regression import TestFactory
 from cocotb.triggers import Timer, RisingEdge, FallingEdge
-from cocotbext.wishbone.driver import WishboneMaster, WBOp
+from cocotbext.wishbone.driver import WishboneMaster
 from cocotbext.axi import AxiStreamBus, AxiStreamSource
-from cocotbext.spi import SpiMaster, SpiSignals, SpiConfig, SpiSlaveBase
+from wfg_registers import DriveSpi
+from wishbone_config import WishboneConfig
+from capture import SpiCapture
+from sweep import SweepFactory, Testbench
 #from random import randbytes # Possible in Python 3.9+
 
 CLK_PER_SYNC = 300
-SYSCLK = 100000000
 DATA_CNT = 10
 
 short_per = Timer(100, units="ns")
 long_time = Timer(100, units="us")
 
-async def drive_sync(dut):
-    dut.wfg_core_sync_i.value = 0
-    sync_cnt = 0
-    while True:
-        await RisingEdge(dut.io_wbs_clk)
-        if sync_cnt == CLK_PER_SYNC-1:
-            sync_cnt = 0
-            dut.wfg_core_sync_i.value = 1
-        else:
-            sync_cnt = sync_cnt + 1
-            dut.wfg_core_sync_i.value = 0
-
-async def set_register(dut, wbs, address, data):
-    dut._log.info(f"Set register {address} : {data}")
-
-    wbRes = await wbs.send_cycle([WBOp(address, data)])
-    
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
-
 async def configure(dut, wbs, en=1, cnt=3, cpol=0, lsbfirst=0, dff=0, sspol=0):
-    await set_register(dut, wbs, 0x8, cnt) # Clock divider
-    await set_register(dut, wbs, 0x4, (cpol<<0) | (lsbfirst<<1) | (dff<<2) | (sspol<<4))
-    await set_register(dut, wbs, 0x0, en) # Enable SPI
-
-class SimpleSpiSlave(SpiSlaveBase):
-  def __init__(self, dut, signals, config):
-    self._config = config
-    self.content = 0
-    super().__init__(signals)
-    self.latest_value = None
-
-  async def get_content(self):
-    await self.idle.wait()
-    return self.content
-
-  async def _transaction(self, frame_start, frame_end):
-    await frame_start
-    self.content = int(await self._shift(self._config.word_width, tx_word=None))
-    await frame_end
-    
-    # For now we have to mirror the bits ourselves
-    if not self._config.msb_first:
-        mirrored = 0
-        bit_length = self._config.word_width
-        for bit_pos in range(bit_length):
-            mirrored |= ((self.content & 1<<(bit_pos)) > 0) << (bit_length-1-bit_pos)
-        self.content = mirrored
-    
-    self.latest_value = self.content.to_bytes(self._config.word_width // 8, 'big')
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(DriveSpi, clkcfg=dict(div=cnt), # Clock divider
+                     cfg=dict(cpol=cpol, lsbfirst=lsbfirst, dff=dff, sspol=sspol),
+                     ctrl=dict(en=en)) # Enable SPI
+    await config.apply()
 
-@cocotb.coroutine
-async def spi_test(dut, en, cnt, cpol, lsbfirst, dff, sspol):
-    dut._log.info(f"Configuration: en={en}, cnt={cnt}, cpol={cpol}, lsbfirst={lsbfirst}, dff={dff}, sspol={sspol}")
+async def setup(dut):
+    # Sync pulses, reset and the bus models, shared by all configurations of a sweep
 
-    cocotb.start_soon(Clock(dut.io_wbs_clk, 1/SYSCLK*1e9, units="ns").start())
-    cocotb.fork(drive_sync(dut))
+    # One sync pulse every CLK_PER_SYNC clocks from sync_stim in the testbench
+    dut.sync_stim.subcycle_clocks.value = CLK_PER_SYNC
+    dut.sync_stim.sync_subcycles.value = 1
 
     dut._log.info("Initialize and reset model")
 
@@ -82,7 +38,7 @@ async def spi_test(dut, en, cnt, cpol, lsbfirst, dff, sspol):
     dut.io_wbs_rst.value = 1
     dut.wfg_axis_tdata.value = 0x00000000
     dut.wfg_axis_tlast.value = 0
-    dut.wfg_axis_tvalid.value = 1
+    dut.wfg_axis_tvalid.value = 0
     
     await Timer(100, units='ns')
 
@@ -94,38 +50,25 @@ async def spi_test(dut, en, cnt, cpol, lsbfirst, dff, sspol):
                               width=32,   # size of data bus
                               timeout=10) # in clock cycle number
 
-    # Setup as SPI Master
-    await configure(dut, wbs,  en=en, cnt=cnt, cpol=cpol, lsbfirst=lsbfirst, dff=dff, sspol=sspol)
-
-    # Create SPI Slave
-    spi_signals = SpiSignals(
-        sclk = dut.wfg_drive_spi_sclk_o,
-        mosi = dut.wfg_drive_spi_sdo_o,
-        miso = dut.wfg_drive_spi_sdi_i,
-        cs   = dut.wfg_drive_spi_cs_no,
-        cs_active_low = not sspol
-    )
-
-    spi_config = SpiConfig(
-        word_width          = (8 * (dff + 1)),          # number of bits in a SPI transaction
-        sclk_freq           = SYSCLK/((cnt + 1) * 2),   # clock rate in Hz
-        cpol                = cpol,                     # clock idle polarity
-        cpha                = False,                     # clock phase (CPHA=True means sample on FallingEdge)
-        msb_first           = not lsbfirst,             # the order that bits are clocked onto the wire
-        data_output_idle    = 1,                        # the idle value of the MOSI or MISO line 
-        frame_spacing_ns    = 1                         # the spacing between frames that the master waits for or the slave obeys
-                                                        #       the slave should raise SpiFrameError if this is not obeyed.
-    )
-
-    spi_slave = SimpleSpiSlave(dut, spi_signals, spi_config)
+    axis_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
+
+    return Testbench(dut, wbs=wbs, axis_source=axis_source)
+
+async def spi_test(tb, en, cnt, cpol, lsbfirst, dff, sspol):
+    dut = tb.dut
+    dut._log.info(f"Configuration: en={en}, cnt={cnt}, cpol={cpol}, lsbfirst={lsbfirst}, dff={dff}, sspol={sspol}")
+
+    # Setup as SPI Master, the previous configuration has sent all its words
+    await configure(dut, tb.wbs,  en=en, cnt=cnt, cpol=cpol, lsbfirst=lsbfirst, dff=dff, sspol=sspol)
 
     await short_per
-    await short_per
-    
-    #await RisingEdge(dut.wfg_core_sync_i)
 
-    axis_source = AxiStreamSource(AxiStreamBus.from_prefix(dut, "wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
+    # Record the pins while the bus is idle, the frames are decoded at the end
+    spi = SpiCapture(dut.wfg_drive_spi_sclk_o, dut.wfg_drive_spi_sdo_o, dut.wfg_drive_spi_cs_no,
+                     width=8 * (dff + 1), cpol=cpol, lsbfirst=lsbfirst, sspol=sspol).start()
 
+    # One word is sent per sync pulse
+    words = []
     for i in range(DATA_CNT):
     
         random_bytes = os.getrandom(dff + 1, os.GRND_NONBLOCK) 
@@ -133,24 +76,25 @@ async def spi_test(dut, en, cnt, cpol, lsbfirst, dff, sspol):
         
         dut._log.info("Sending data: 0x{}".format(random_bytes.hex()))
         
-        await axis_source.send([int.from_bytes(random_bytes, "big")])
-        # wait for operation to complete
-        await axis_source.wait()
+        await tb.axis_source.send([int.from_bytes(random_bytes, "big")])
+        words.append(int.from_bytes(random_bytes, "big"))
 
-        await RisingEdge(dut.wfg_core_sync_i)
+    await spi.wait(DATA_CNT)
+    spi.stop()
+    frames = spi.frames()
 
-        await short_per
-        
-        dut._log.info("SPI received: 0x{}".format(spi_slave.latest_value.hex()))
-        
-        assert random_bytes == spi_slave.latest_value
-       
+    for (value, bits) in zip(frames["value"], frames["bits"]):
+        dut._log.info("SPI received: 0x{:0{}x} in {} bits".format(int(value), 2 * (dff + 1), bits))
+
+    assert list(frames["bits"]) == [8 * (dff + 1)] * DATA_CNT
+    assert list(frames["value"]) == words
     
     await short_per
 
-factory = TestFactory(spi_test)
+# With SWEEP=1 all configurations run in one test, dense enough to cover more clock dividers
+factory = SweepFactory(spi_test, setup)
 factory.add_option("en", [1])
-factory.add_option("cnt", [3])
+factory.add_option("cnt", [0, 1, 3, 7] if factory.sweep else [3])
 factory.add_option("cpol", [0, 1])
 factory.add_option("lsbfirst", [0, 1])
 factory.add_option("dff", [0,1,2,3])
@@ -11,10 +11,11 @@
 
 module wfg_drive_spi_tb #(
     parameter int BUSW = 32,
-    parameter int AXIS_DATA_WIDTH = 32
+    parameter int AXIS_DATA_WIDTH = 32,
+    parameter int CLK_PERIOD = 10  // Clock period in ns
 ) (
     // Wishbone interface signals
-    input               io_wbs_clk,
+    output logic        io_wbs_clk,  // Generated here, a clock driven from Python wakes it every half period
     input               io_wbs_rst,
     input  [(BUSW-1):0] io_wbs_adr,
     input  [(BUSW-1):0] io_wbs_datwr,
@@ -24,9 +25,9 @@ module wfg_drive_spi_tb #(
     output              io_wbs_ack,
     input               io_wbs_cyc,
 
-    // Bus master A interface
-    input logic wfg_core_sync_i,     // I; Single cycle pulse for write access
-    input logic wgf_core_subcycle_i, // I; Single cycle pulse for read access
+    // Core synchronisation interface, generated by sync_stim
+    output wire wfg_core_sync_i,     // O; Sync pulse
+    output wire wgf_core_subcycle_i, // O; Subcycle pulse
 
     // AXI-Stream interface
     output wire                        wfg_axis_tready,  // O; ready
@@ -41,6 +42,20 @@ module wfg_drive_spi_tb #(
     input  wire wfg_drive_spi_sdi_i    // I; data in, dummy signal for cocotb
 );
 
+    initial begin
+        io_wbs_clk = 1'b0;
+        forever #(CLK_PERIOD / 2.0) io_wbs_clk = ~io_wbs_clk;
+    end
+
+    // Sync and subcycle pulses, configured once from Python
+    sync_stim sync_stim (
+        .clk           (io_wbs_clk),
+        .rst_n         (!io_wbs_rst),
+        .sync_o        (wfg_core_sync_i),
+        .subcycle_o    (wgf_core_subcycle_i),
+        .subcycle_cnt_o()
+    );
+
     wfg_drive_spi_top wfg_drive_spi_top (
         .wb_clk_i (io_wbs_clk),
         .wb_rst_i (io_wbs_rst),
@@ -66,10 +81,12 @@ module wfg_drive_spi_tb #(
         .wfg_drive_spi_sdo_o (wfg_drive_spi_sdo_o)
     );
 
-    // Dump waves
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_drive_spi_tb.vcd");
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_drive_spi_tb.vcd";
+        $dumpfile(dumpfile);
         $dumpvars(0, wfg_drive_spi_tb);
     end
 `endif
@@ -7,8 +7,10 @@ from cocotb.clock import Clock
 from cocotb.regression import TestFactory
 from cocotb.triggers import Timer, RisingEdge, FallingEdge
 from cocotbext.wishbone.driver import WishboneMaster
-from cocotbext.wishbone.driver import WBOp
-from cocotbext.axi import AxiStreamBus, AxiStreamSource, AxiStreamSink
+from wfg_registers import Interconnect
+from wishbone_config import WishboneConfig
+from cocotbext.axi import AxiStreamBus, AxiStreamSource
+from capture import RecorderCapture
 from cocotbext.spi import SpiMaster, SpiSignals, SpiConfig, SpiSlaveBase
 #from random import randbytes # Possible in Python 3.9+
 
@@ -19,21 +21,10 @@ NUM_CHANNELS = 2
 short_per = Timer(100, units="ns")
 long_time = Timer(100, units="us")
 
-async def set_register(dut, wbs, address, data):
-    dut._log.info(f"Set register {address} : {data}")
-    wbRes = await wbs.send_cycle([WBOp(address, data)])
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
-
 async def configure(dut, wbs, en=1, select0=0, select1=0):
-    await set_register(dut, wbs, 0x8, select1)
-    await set_register(dut, wbs, 0x4, select0)
-    await set_register(dut, wbs, 0x0, en) # Enable
-
-async def receive_data(axis_sink, received_data, cnt):
-    while 1:
-        data = await axis_sink.recv()
-        received_data[cnt].append(data.tdata[0])
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(Interconnect, driver1=dict(select=select1), driver0=dict(select=select0), ctrl=dict(en=en)) # Enable
+    await config.apply()
 
 @cocotb.coroutine
 async def test_interconnect(dut, en, select0, select1):
@@ -43,8 +34,6 @@ async def test_interconnect(dut, en, select0, select1):
 
     dut._log.info("Initialize and reset model")
     
-    received_data = [[] for y in range(NUM_CHANNELS)]
-    
     # Start reset
     dut.io_wbs_rst.value = 1
     dut.stimulus_0.value = 1
@@ -67,12 +56,11 @@ async def test_interconnect(dut, en, select0, select1):
     
     axis_stimulus_1 = AxiStreamSource(AxiStreamBus.from_prefix(dut, "stimulus_1_wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
 
-    axis_driver_0 = AxiStreamSink(AxiStreamBus.from_prefix(dut, "driver_0_wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
+    # The drivers are always ready, their beats are recorded inside the simulator
+    dut.driver_0_wfg_axis_tready.value = 1
+    dut.driver_1_wfg_axis_tready.value = 1
 
-    axis_driver_1 = AxiStreamSink(AxiStreamBus.from_prefix(dut, "driver_1_wfg_axis"), dut.io_wbs_clk, dut.io_wbs_rst)
-    
-    cocotb.start_soon(receive_data(axis_driver_0, received_data, 0))
-    cocotb.start_soon(receive_data(axis_driver_1, received_data, 1))
+    captures = [RecorderCapture(dut.recorder_0), RecorderCapture(dut.recorder_1)]
 
     send_data = [[int.from_bytes(os.getrandom(4, os.GRND_NONBLOCK), "big") for _ in range(DATA_CNT)] for y in range(NUM_CHANNELS)]
 
@@ -86,7 +74,10 @@ async def test_interconnect(dut, en, select0, select1):
 
             await short_per
     
-    await short_per
+    for capture in captures:
+        await capture.wait(DATA_CNT)
+
+    received_data = [capture.arrays()["value"].tolist() for capture in captures]
 
     if select0 == 0 and select1 == 0:
         assert(received_data[0] == send_data[0])
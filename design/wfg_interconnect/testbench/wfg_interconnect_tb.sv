@@ -94,11 +94,39 @@ module wfg_interconnect_tb #(
         .wfg_axis_tready_driver_1(driver_1_wfg_axis_tready)
     );
 
-    // Dump waves
+    // Records the stream of driver 0 for the readout at the end of the test
+    axis_recorder #(
+        .DATA_WIDTH(32),
+        .DEPTH     (1024)
+    ) recorder_0 (
+        .clk   (io_wbs_clk),
+        .rst_n (!io_wbs_rst),
+        .tvalid(driver_0_wfg_axis_tvalid),
+        .tready(driver_0_wfg_axis_tready),
+        .tdata (driver_0_wfg_axis_tdata)
+    );
+
+    // Records the stream of driver 1 for the readout at the end of the test
+    axis_recorder #(
+        .DATA_WIDTH(32),
+        .DEPTH     (1024)
+    ) recorder_1 (
+        .clk   (io_wbs_clk),
+        .rst_n (!io_wbs_rst),
+        .tvalid(driver_1_wfg_axis_tvalid),
+        .tready(driver_1_wfg_axis_tready),
+        .tdata (driver_1_wfg_axis_tdata)
+    );
+
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_interconnect_tb.vcd");
-        $dumpvars(0, wfg_interconnect_tb);
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_interconnect_tb.vcd";
+        $dumpfile(dumpfile);
+        // Not the recorder, its memories would be written to the dump with every beat
+        $dumpvars(1, wfg_interconnect_tb);
+        $dumpvars(0, wfg_interconnect_tb.wfg_interconnect_top);
     end
 `endif
 
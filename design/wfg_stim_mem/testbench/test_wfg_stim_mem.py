@@ -1,39 +1,35 @@
 # SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
 # SPDX-License-Identifier: Apache-2.0
 
-import math
-import statistics
+import numpy as np
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import Timer, RisingEdge, FallingEdge
-from cocotb.regression import TestFactory
 from cocotbext.wishbone.driver import WishboneMaster
-from cocotbext.wishbone.driver import WBOp
+from wfg_registers import StimMem
+from wishbone_config import WishboneConfig
+from capture import RecorderCapture
+import soak
+from sweep import SweepFactory, Testbench
 
 DATA_CNT = 10
 
+# Soak settings, memory.hex holds the address in each of its 32 words
+SOAK_START = 0x0000
+SOAK_END = 0x001F
+SOAK_INC = 0x01
+SOAK_GAIN = 0x0003
+
 short_per = Timer(100, units="ns")
 long_time = Timer(100, units="us")
 
-async def set_register(dut, wbs, peripheral_address, address, data):
-    if address > 0xF:
-        dut._log.error("Can not access peripheral registers outside 0xF")
-
-    real_address = (peripheral_address<<4) | (address & 0xF)
-    dut._log.info(f"Set register {real_address} : {data}")
-
-    wbRes = await wbs.send_cycle([WBOp(real_address, data)])
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
-
 async def configure_stim_mem(dut, wbs, en, start=0x0000, end=0x0000, inc=0x01, gain=0x0001):
-    await set_register(dut, wbs, 0x0, 0x4, start)
-    await set_register(dut, wbs, 0x0, 0x8, end)
-    await set_register(dut, wbs, 0x0, 0xC, gain<<8 | inc)
-    await set_register(dut, wbs, 0x0, 0x0, en) # Enable
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(StimMem, start=dict(val=start), end=dict(val=end), cfg=dict(gain=gain, inc=inc), ctrl=dict(en=en)) # Enable
+    await config.apply()
 
-@cocotb.coroutine
-async def mem_test(dut, start=0x0000, end=0x0000, inc=0x01, gain=0x0001):
+async def setup(dut):
+    # Clock, reset and the wishbone master, shared by all configurations of a sweep
     cocotb.start_soon(Clock(dut.io_wbs_clk, 10, units="ns").start())
 
     dut._log.info("Initialize and reset model")
@@ -53,31 +49,69 @@ async def mem_test(dut, start=0x0000, end=0x0000, inc=0x01, gain=0x0001):
                               timeout=10) # in clock cycle number
 
     await short_per
-    
-    dut._log.info("Configure stim_mem")
-    await configure_stim_mem(dut, wbs, en=1, start=start, end=end, inc=inc, gain=gain)
 
-    cur_address = start
+    return Testbench(dut, wbs=wbs)
+
+async def mem_test(tb, start=0x0000, end=0x0000, inc=0x01, gain=0x0001):
+    dut = tb.dut
+
+    # Only beats of this configuration
+    capture = RecorderCapture(dut.recorder)
+
+    dut._log.info("Configure stim_mem")
+    await configure_stim_mem(dut, tb.wbs, en=1, start=start, end=end, inc=inc, gain=gain)
 
     # Gather data
-    for i in range(DATA_CNT):
-        await FallingEdge(dut.wfg_axis_tvalid)
-        value = dut.wfg_axis_tdata.value
-        
-        dut._log.info(f"Test: {cur_address} == {value}")
-        
-        assert(cur_address*gain == value)
-        
-        cur_address += inc
-        
-        if (cur_address > end):
-            cur_address = start
-
-factory = TestFactory(mem_test)
-
-factory.add_option("start", [0x0000, 0x0010])
-factory.add_option("end", [0x0005, 0x001F])
-factory.add_option("inc", [0x01, 0x02])
-factory.add_option("gain", [0x01, 0x04])
+    await capture.wait(DATA_CNT)
+    values = capture.arrays()["value"][:DATA_CNT]
+
+    # Disabled, the address returns to start for the next configuration once the last beat is out
+    await configure_stim_mem(dut, tb.wbs, en=0, start=start, end=end, inc=inc, gain=gain)
+    await short_per
+
+    # The address wraps to start after passing end, with start after end it stays at start
+    addresses = start + (np.arange(DATA_CNT) % max((end - start) // inc + 1, 1)) * inc
+
+    for (address, value) in zip(addresses, values):
+        dut._log.info(f"Test: {address} == {value}")
+
+    assert np.array_equal(addresses * gain, values)
+
+# With SWEEP=1 all configurations run in one test, dense enough to cover odd increments and empty ranges
+factory = SweepFactory(mem_test, setup)
+
+factory.add_option("start", [0x0000, 0x0010] + ([0x0003] if factory.sweep else []))
+factory.add_option("end", [0x0005, 0x001F] + ([0x0000, 0x0016] if factory.sweep else []))
+factory.add_option("inc", [0x01, 0x02] + ([0x03] if factory.sweep else []))
+factory.add_option("gain", [0x01, 0x04] + ([0x10] if factory.sweep else []))
 
 factory.generate_tests()
+
+@cocotb.test(skip=soak.samples() == 0)
+async def soak_test(dut):
+    # SOAK=<samples> streams that many samples through constant memory checks
+    tb = await setup(dut)
+    num_values = soak.samples()
+
+    capture = RecorderCapture(dut.recorder)
+    await configure_stim_mem(dut, tb.wbs, en=1, start=SOAK_START, end=SOAK_END, inc=SOAK_INC, gain=SOAK_GAIN)
+
+    # The histogram of the addresses shows that every word was read equally often
+    check = soak.SoakCheck("wfg_stim_mem", dut._log, histogram_range=(SOAK_START, SOAK_END + 1), bins=SOAK_END + 1 - SOAK_START)
+    length = (SOAK_END - SOAK_START) // SOAK_INC + 1
+    done = 0
+
+    async for chunk in capture.stream(num_values):
+        addresses = SOAK_START + ((done + np.arange(len(chunk["value"]))) % length) * SOAK_INC
+        check.check(chunk["value"], addresses * SOAK_GAIN)
+        check.histogram.update(chunk["value"] // SOAK_GAIN)
+        done += len(chunk["value"])
+
+        if done % (1 << 16) == 0:
+            check.report()
+
+    check.report()
+    soak.save([check], "soak_test.json")
+
+    counts = check.histogram.counts
+    assert counts.max() - counts.min() <= 1, "Addresses read unevenly: {}".format(counts)
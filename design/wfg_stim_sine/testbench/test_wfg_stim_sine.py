@@ -1,39 +1,41 @@
 # SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
 # SPDX-License-Identifier: Apache-2.0
 
-import math
-import statistics
+import numpy as np
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import Timer, RisingEdge, FallingEdge
-from cocotb.regression import TestFactory
 from cocotbext.wishbone.driver import WishboneMaster
-from cocotbext.wishbone.driver import WBOp
+from wfg_registers import StimSine
+from wishbone_config import WishboneConfig
+import stim_sine_model
+import spectrum
+import soak
+from capture import RecorderCapture
+from sweep import SweepFactory, Testbench
 
 DATA_CNT = 10
 
-short_per = Timer(100, units="ns")
-long_time = Timer(100, units="us")
+# Limits of the spectral metrics, the model reaches 68 dB and 10.3 bits at the lowest gains
+MIN_SFDR_DB = 60
+MIN_ENOB = 10
 
-async def set_register(dut, wbs, peripheral_address, address, data):
-    if address > 0xF:
-        dut._log.error("Can not access peripheral registers outside 0xF")
+# Soak settings, every phase is visited and the CORDIC stays within the deviation
+SOAK_INC = 0x0123
+SOAK_GAIN = 0x6000
+SOAK_OFFSET = 0x0000
+MAX_DEVIATION = 0.001
 
-    real_address = (peripheral_address<<4) | (address & 0xF)
-    dut._log.info(f"Set register {real_address} : {data}")
-
-    wbRes = await wbs.send_cycle([WBOp(real_address, data)])
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
+short_per = Timer(100, units="ns")
+long_time = Timer(100, units="us")
 
 async def configure_stim_sine(dut, wbs, en, inc=0x1000, gain=0x4000, offset=0):
-    await set_register(dut, wbs, 0x0, 0x4, inc)
-    await set_register(dut, wbs, 0x0, 0x8, gain)
-    await set_register(dut, wbs, 0x0, 0xC, offset)
-    await set_register(dut, wbs, 0x0, 0x0, en) # Enable
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(StimSine, inc=dict(val=inc), gain=dict(val=gain), offset=dict(val=offset), ctrl=dict(en=en)) # Enable
+    await config.apply()
 
-@cocotb.coroutine
-async def sine_test(dut, sine_inc=0x1000, sine_gain=0x4000, sine_offset=0):
+async def setup(dut):
+    # Clock, reset and the wishbone master, shared by all configurations of a sweep
     cocotb.start_soon(Clock(dut.io_wbs_clk, 10, units="ns").start())
 
     dut._log.info("Initialize and reset model")
@@ -53,58 +55,90 @@ async def sine_test(dut, sine_inc=0x1000, sine_gain=0x4000, sine_offset=0):
                               timeout=10) # in clock cycle number
 
     await short_per
-    
-    dut._log.info("Configure stim_sine")
-    await configure_stim_sine(dut, wbs, en=1, inc=sine_inc, gain=sine_gain, offset=sine_offset)
 
-    num_values = int((2**16) / sine_inc + 1)
-    y_data = []
+    # phase_in keeps its value while disabled, the next configuration starts from there
+    return Testbench(dut, wbs=wbs, phase=0)
+
+async def sine_test(tb, sine_inc=0x1000, sine_gain=0x4000, sine_offset=0):
+    dut = tb.dut
+
+    # A whole period for the spectral metrics if it fits into the recorder
+    capture = RecorderCapture(dut.recorder, signed=True)
+    (period, _) = spectrum.coherent_period(sine_inc)
+    num_values = max(int((2**16) / sine_inc + 1), period if period <= capture.depth else 0)
+
+    dut._log.info("Configure stim_sine")
+    await configure_stim_sine(dut, tb.wbs, en=1, inc=sine_inc, gain=sine_gain, offset=sine_offset)
 
     # Gather data
-    for i in range(num_values):
-        await FallingEdge(dut.wfg_axis_tvalid)
-        value = int(dut.wfg_axis_tdata.value)
-        
-        # Sign extend
-        if value & (1<<17):
-            value |= ((1<<14)-1)<<18
-            
-        value = value.to_bytes(4, 'big')
-        value = int.from_bytes(value, 'big', signed=True)
-        y_data.append(value)
-
-    y_data_float = []
-    
-    y_error = []
-    y_squared_error = []
-    y_absolute_error = []
-
-    # Compare results
-    for (cnt, value) in enumerate(y_data):
-        input_val = cnt * sine_inc
-        while input_val >= (2**16):
-            input_val -= (2**16)
-    
-        angle_rad = float(input_val) / (2**16) * 2 * math.pi
-        calculated_value = math.sin(angle_rad) * (sine_gain / 2**14) + (sine_offset/2**16)
-        output_as_float = float(value) / (2**16)
-        y_data_float.append(output_as_float)
-        y_error.append(output_as_float - calculated_value)
-        y_squared_error.append((output_as_float - calculated_value)**2)
-        y_absolute_error.append(abs(output_as_float - calculated_value))
-    
-    y_mean_squared_error = statistics.mean(y_squared_error)
+    await capture.wait(num_values)
+    y_data = capture.arrays()["value"][:num_values]
+
+    # Disabled after the sample in progress, about 20 cycles, every transfer advanced the phase by inc
+    await configure_stim_sine(dut, tb.wbs, en=0, inc=sine_inc, gain=sine_gain, offset=sine_offset)
+    await Timer(300, units="ns")
+    phases = stim_sine_model.phases(sine_inc, num_values, start=tb.phase)
+    tb.phase = (tb.phase + capture.count * sine_inc) & 0xFFFF
+
+    # The model predicts every sample exactly
+    y_model = stim_sine_model.stim_sine(phases, sine_gain, sine_offset)
+    mismatches = np.flatnonzero(y_data != y_model)
+
+    for index in mismatches[:10]:
+        dut._log.error("Sample {}: got {}, expected {}".format(index, y_data[index], y_model[index]))
+
+    assert len(mismatches) == 0, "{} of {} samples differ from the model".format(len(mismatches), num_values)
+
+    # Accuracy of the CORDIC against the ideal sine
+    y_error = y_data / (2**16) - stim_sine_model.ideal(phases, sine_gain, sine_offset)
+
+    y_mean_squared_error = np.mean(y_error**2)
     dut._log.info("y_mean_squared_error: {}".format(y_mean_squared_error))
-    
-    y_mean_absolute_error = statistics.mean(y_absolute_error)
+
+    y_mean_absolute_error = np.mean(np.abs(y_error))
     dut._log.info("y_mean_absolute_error: {}".format(y_mean_absolute_error))
 
     assert(y_mean_absolute_error < 0.001)
 
-factory = TestFactory(sine_test)
+    # Spectral purity of one coherent period
+    if num_values >= period:
+        result = spectrum.metrics(y_data, sine_inc)
+        dut._log.info("SFDR {sfdr_db:.2f} dB, SNR {snr_db:.2f} dB, THD {thd_db:.2f} dB, ENOB {enob:.2f} over {samples} samples".format(**result))
+
+        assert result["sfdr_db"] > MIN_SFDR_DB and result["enob"] > MIN_ENOB
+
+# With SWEEP=1 all configurations run in one test, dense enough to cover odd increments, small gains and more offsets
+factory = SweepFactory(sine_test, setup)
 
-factory.add_option("sine_inc", [0x500, 0x1000])
-factory.add_option("sine_gain", [0x4000, 0x2000, 0x6000])
-factory.add_option("sine_offset", [0x0000, 0x8000])
+factory.add_option("sine_inc", [0x500, 0x1000, 0xF000] + ([0x0123, 0x2345] if factory.sweep else []))
+factory.add_option("sine_gain", [0x4000, 0x2000, 0x6000] + ([0x0100, 0x1000] if factory.sweep else []))
+factory.add_option("sine_offset", [0x0000, 0x8000] + ([0x1234, 0x4000] if factory.sweep else []))
 
 factory.generate_tests()
+
+@cocotb.test(skip=soak.samples() == 0)
+async def soak_test(dut):
+    # SOAK=<samples> streams that many samples through constant memory checks
+    tb = await setup(dut)
+    num_values = soak.samples()
+
+    capture = RecorderCapture(dut.recorder, signed=True)
+    await configure_stim_sine(dut, tb.wbs, en=1, inc=SOAK_INC, gain=SOAK_GAIN, offset=SOAK_OFFSET)
+
+    check = soak.SoakCheck("wfg_stim_sine", dut._log, max_deviation=MAX_DEVIATION,
+                           histogram_range=(-MAX_DEVIATION, MAX_DEVIATION))
+    done = 0
+
+    async for chunk in capture.stream(num_values):
+        phases = stim_sine_model.phases(SOAK_INC, len(chunk["value"]), start=done * SOAK_INC)
+        y_model = stim_sine_model.stim_sine(phases, SOAK_GAIN, SOAK_OFFSET)
+        y_error = chunk["value"] / (2**16) - stim_sine_model.ideal(phases, SOAK_GAIN, SOAK_OFFSET)
+
+        check.check(chunk["value"], y_model, y_error)
+        done += len(chunk["value"])
+
+        if done % (1 << 16) == 0:
+            check.report()
+
+    check.report()
+    soak.save([check], "soak_test.json")
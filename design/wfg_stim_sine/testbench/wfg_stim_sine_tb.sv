@@ -46,11 +46,27 @@ module wfg_stim_sine_tb #(
         .wfg_axis_tdata_o (wfg_axis_tdata)
     );
 
-    // Dump waves
+    // Records the output stream for the readout at the end of the test
+    axis_recorder #(
+        .DATA_WIDTH(18),
+        .DEPTH     (1024)
+    ) recorder (
+        .clk   (io_wbs_clk),
+        .rst_n (!io_wbs_rst),
+        .tvalid(wfg_axis_tvalid),
+        .tready(wfg_axis_tready),
+        .tdata (wfg_axis_tdata)
+    );
+
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_stim_sine_tb.vcd");
-        $dumpvars(0, wfg_stim_sine_tb);
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_stim_sine_tb.vcd";
+        $dumpfile(dumpfile);
+        // Not the recorder, its memories would be written to the dump with every beat
+        $dumpvars(1, wfg_stim_sine_tb);
+        $dumpvars(0, wfg_stim_sine_tb.wfg_stim_sine_top);
     end
 `endif
 
@@ -3,37 +3,27 @@
 
 import random
 import cocotb
-from cocotb.clock import Clock
 from cocotb.regression import TestFactory
-from cocotb.triggers import Timer, RisingEdge, FallingEdge, ClockCycles
+from cocotb.triggers import Timer
 from cocotbext.wishbone.driver import WishboneMaster
-from cocotbext.wishbone.driver import WBOp
+from wfg_registers import Subcore
+from wishbone_config import WishboneConfig
+from sync_checker import check_sync, full_range
 
-CLK_PER_SYNC = 300
-SYSCLK = 100000000
 DATA_CNT = 10
 
 short_per = Timer(100, units="ns")
 long_time = Timer(100, units="us")
 
-async def set_register(dut, wbs, address, data):
-    dut._log.info(f"Set register {address} : {data}")
-
-    wbRes = await wbs.send_cycle([WBOp(address, data)])
-    
-    rvalues = [wb.datrd for wb in wbRes]
-    dut._log.info(f"Returned values : {rvalues}")
-
 async def configure(dut, wbs, en, sync_count, subcycle_count):
-    await set_register(dut, wbs, 0x4, (sync_count << 0) | (subcycle_count << 8))
-    await set_register(dut, wbs, 0x0, en) # Enable subcore
+    config = WishboneConfig(dut, wbs, top=False)
+    config.configure(Subcore, cfg=dict(sync=sync_count, subcycle=subcycle_count), ctrl=dict(en=en)) # Enable subcore
+    await config.apply()
 
 @cocotb.coroutine
 async def subcore_test(dut, en, sync_count, subcycle_count):
     dut._log.info(f"Configuration: sync_count={sync_count}, subcycle_count={subcycle_count}")
 
-    cocotb.start_soon(Clock(dut.io_wbs_clk, 1/SYSCLK*1e9, units="ns").start())
-
     dut._log.info("Initialize and reset model")
 
     # Start reset
@@ -51,39 +41,11 @@ async def subcore_test(dut, en, sync_count, subcycle_count):
     # Setup subcore
     await configure(dut, wbs, en, sync_count, subcycle_count)
 
-    #await short_per
-    #await short_per
-    
-    sync_pulse_count = 0
-    clk_count = 0
-    
-    await FallingEdge(dut.wfg_subcore_sync_o)
-
-    for i in range ((sync_count + 1) * (subcycle_count + 1) * 3):
-        await ClockCycles(dut.io_wbs_clk, 1)
-        clk_count += 1
-   
-        if dut.wfg_subcore_sync_o == 1:
-            assert ((sync_pulse_count+1) * clk_count) == ((sync_count + 1) * (subcycle_count + 1) * 2)
-            break
-            
-        if (dut.wfg_subcore_subcycle_o == 1):
-            sync_pulse_count += 1
-            clk_count = 0
-
-length = 2
+    await check_sync(dut, dut.io_wbs_clk, dut.wfg_subcore_sync_o, dut.wfg_subcore_subcycle_o, sync_count, subcycle_count)
 
-sync_array = []
-
-for i in range(length):
-    n = random.randint(1,2**7)
-    sync_array.append(n)
-
-subcycle_array = []
-
-for i in range(length):
-    n = random.randint(1,2**7)
-    subcycle_array.append(n)
+# Random values and the smallest counts, FULL_RANGE=1 adds the largest 8-bit sync count
+sync_array = [random.randint(1, 2**7), 0] + ([2**8 - 1] if full_range() else [])
+subcycle_array = [random.randint(1, 2**7), 0]
 
 
 factory = TestFactory(subcore_test)
@@ -92,3 +54,8 @@ factory.add_option("sync_count", sync_array)
 factory.add_option("subcycle_count", subcycle_array)
 
 factory.generate_tests()
+
+# The largest counts of both, simulated once and not crossed with the other values
+@cocotb.test(skip=not full_range())
+async def subcore_full_range_test(dut):
+    await subcore_test(dut, 1, 2**8 - 1, 2**16 - 1)
@@ -69,10 +69,12 @@ module wfg_top_tb #(
         if (!csb1) dout1 <= mem[addr1];
     end
 
-    // Dump waves
+    // Dump waves, +dumpfile=<path> writes them to another file
 `ifndef VERILATOR
     initial begin
-        $dumpfile("wfg_top_tb.vcd");
+        string dumpfile;
+        if (!$value$plusargs("dumpfile=%s", dumpfile)) dumpfile = "wfg_top_tb.vcd";
+        $dumpfile(dumpfile);
         $dumpvars(0, wfg_top_tb);
     end
 `endif
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import time
+import json
+import argparse
+import pathlib
+import tempfile
+import tracemalloc
+
+import generator
+
+TEMPLATE_DIR = pathlib.Path(__file__).parent / "templates"
+
+# Template used for every marker block of the synthetic files
+BLOCK_TEMPLATE = "wishbone/reset_registers.template"
+
+def make_library(num_registers):
+    json_dict = {"registers" : {}}
+
+    for reg_cnt in range(num_registers):
+        json_dict["registers"]["REG{}".format(reg_cnt)] = {"address" : "16'h{:04X}".format(reg_cnt * 4),
+                                                          "description" : "Synthetic register {}".format(reg_cnt),
+                                                          "entries" : {"VAL" : {"access" : "rw",
+                                                                                "hardware" : "cfg",
+                                                                                "LSB" : "0",
+                                                                                "MSB" : "31",
+                                                                                "reset" : "32'h0",
+                                                                                "description" : "Value"
+                                                                                }
+                                                                       }
+                                                          }
+    return json_dict
+
+def make_sv_file(filename, size, data_name, lines_per_block=1000):
+    # Hand written lines with a marker block in between
+    line_cnt = 0
+    written = 0
+
+    with open(filename, "w") as f:
+        f.write("module synthetic;\n")
+
+        while written < size:
+            line = "    logic [31:0] signal_{:08d}_ff;  // Hand written signal\n".format(line_cnt)
+            f.write(line)
+            written += len(line)
+            line_cnt += 1
+
+            if line_cnt % lines_per_block == 0:
+                f.write("    //marker_template_start\n")
+                f.write("    //data: {}\n".format(data_name))
+                f.write("    //template: {}\n".format(BLOCK_TEMPLATE))
+                f.write("    //marker_template_code\n")
+                f.write("    //marker_template_end\n")
+
+        f.write("endmodule\n")
+
+def legacy_generate(env, in_filename, out_filename, template_dir):
+    # Reference: the previous implementation building the whole output in memory
+    output_file_content = ""
+
+    with open(in_filename, "r") as input_file:
+        input_file_content = input_file.read()
+
+    read_data = False
+    read_template = False
+    read_code = False
+
+    for line in input_file_content.split('\n'):
+        if read_code:
+            if "marker_template_end" in line:
+                read_code = False
+                whitespace = line[:len(line) - len(line.lstrip())]
+                for generated_line in template.render(data).split('\n'):
+                    output_file_content += whitespace + generated_line + "\n"
+                output_file_content += line + "\n"
+            continue
+
+        if read_data:
+            with open(in_filename.parent / line.strip().split("data:")[1].strip(), "r") as f_json:
+                data = json.load(f_json)
+            output_file_content += line + "\n"
+            read_data = False
+            read_template = True
+            continue
+
+        if read_template:
+            templatepath = template_dir / line.strip().split("template:")[1].strip()
+            template = env.get_template(str(templatepath.resolve()))
+            output_file_content += line + "\n"
+            read_template = False
+            continue
+
+        if "marker_template_start" in line:
+            read_data = True
+        elif "marker_template_code" in line:
+            read_code = True
+
+        output_file_content += line + "\n"
+
+    output_file_content = output_file_content[:-1]
+
+    with open(out_filename, "w") as output_file:
+        output_file.write(output_file_content)
+
+def streaming_generate(env, in_filename, out_filename, template_dir):
+    generator.generate_file(env, in_filename, out_filename, template_dir=template_dir, log=io.StringIO())
+
+def measure(function, *args, repeat=3):
+    # Best of several runs
+    wall_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        run_time = time.perf_counter() - start
+        wall_time = run_time if wall_time is None else min(wall_time, run_time)
+
+    # Second run to get the peak memory without slowing down the timed run
+    tracemalloc.start()
+    function(*args)
+    (_, peak_memory) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return (wall_time, peak_memory)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the template generator on synthetic SystemVerilog files.')
+    parser.add_argument('-s', '--sizes', type=float, nargs='+', default=[1, 4, 16], help='file sizes in MB')
+    parser.add_argument('-r', '--registers', type=int, default=64, help='registers in the data library of each block')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='timed runs per size, the fastest is reported')
+
+    args = parser.parse_args()
+
+    env = generator.get_environment()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+
+        with open(tmp_dir / "bench_reg.json", "w") as f_json:
+            json.dump(make_library(args.registers), f_json)
+
+        print("{:>8} {:>12} {:>12} {:>8} {:>14} {:>14}".format("size/MB", "legacy/s", "streaming/s", "speedup",
+                                                              "legacy/MB", "streaming/MB"))
+
+        for size in args.sizes:
+            in_filename = tmp_dir / "synthetic.sv"
+            legacy_filename = tmp_dir / "legacy.sv"
+            streaming_filename = tmp_dir / "streaming.sv"
+
+            make_sv_file(in_filename, int(size * 2**20), "bench_reg.json")
+
+            (legacy_time, legacy_memory) = measure(legacy_generate, env, in_filename, legacy_filename, TEMPLATE_DIR,
+                                                   repeat=args.repeat)
+            (streaming_time, streaming_memory) = measure(streaming_generate, env, in_filename, streaming_filename,
+                                                         TEMPLATE_DIR, repeat=args.repeat)
+
+            if legacy_filename.read_bytes() != streaming_filename.read_bytes():
+                print("Error: Outputs differ for {} MB".format(size))
+
+            print("{:>8.1f} {:>12.3f} {:>12.3f} {:>8.2f} {:>14.1f} {:>14.1f}".format(size, legacy_time, streaming_time,
+                                                                                   legacy_time / streaming_time,
+                                                                                   legacy_memory / 2**20,
+                                                                                   streaming_memory / 2**20))
+
+if __name__ == "__main__":
+    main()
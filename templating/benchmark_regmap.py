@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import csv
+import json
+import argparse
+import pathlib
+import platform
+import tempfile
+
+import jinja2
+
+import converter
+import generator
+from benchmark import measure
+
+RESULTS_VERSION = 1
+
+TEMPLATE_DIR = pathlib.Path(__file__).parent / "templates"
+
+# Bit fields of each synthetic register, like the real register maps
+FIELDS = [("EN", "rw", "cfg", 0, 0, "1'b0"),
+          ("MODE", "rw", "cfg", 3, 1, "3'b000"),
+          ("VAL", "rw", "cfg", 31, 16, "16'h0000"),
+          ("STAT", "r", "status", 15, 8, "8'h00")]
+
+def make_csv(filename, num_registers, num_fields):
+    with open(filename, "w", newline='') as f_csv:
+        csv_writer = csv.writer(f_csv)
+        csv_writer.writerow(["Address", "RegName", "BitName", "Access", "HW", "MSB", "LSB", "Reset", "Description"])
+
+        for reg_cnt in range(num_registers):
+            csv_writer.writerow(["32'h{:08X}".format(reg_cnt * 4), "REG{}".format(reg_cnt), "", "", "", "", "", "",
+                                 "Synthetic register {}".format(reg_cnt)])
+
+            for (name, access, hardware, msb, lsb, reset) in FIELDS[:num_fields]:
+                csv_writer.writerow(["", "", name, access, hardware, msb, lsb, reset,
+                                     "Synthetic field {}".format(name)])
+
+def load_library(filename):
+    with open(filename, "r") as f_json:
+        return json.load(f_json)
+
+def overview_data(data):
+    # register_overview.template takes a list of registers instead of a library
+    registers = []
+
+    for (name, register) in data["registers"].items():
+        bits = max(int(entry["MSB"]) for entry in register["entries"].values()) + 1
+        registers.append({"name" : name, "address" : register["address"].split("'h")[-1], "bits" : bits})
+
+    return {"registers" : registers}
+
+def render_template(template, data):
+    return template.render(data)
+
+def run_stage(results, over_budget, num_registers, stage, name, function, args, repeat, budget):
+    if (stage, name) in over_budget:
+        results.append({"registers" : num_registers, "stage" : stage, "name" : name,
+                        "wall_time" : None, "peak_memory" : None})
+        print("{:>8} {:<8} {:<32} {:>12} {:>12}".format(num_registers, stage, name, "skipped", "-"))
+        return
+
+    (wall_time, peak_memory) = measure(function, *args, repeat=repeat)
+
+    # Larger maps would only take longer, keep the suite runnable
+    if budget is not None and wall_time > budget:
+        over_budget.add((stage, name))
+
+    results.append({"registers" : num_registers, "stage" : stage, "name" : name,
+                    "wall_time" : wall_time, "peak_memory" : peak_memory})
+    print("{:>8} {:<8} {:<32} {:>12.4f} {:>12.2f}".format(num_registers, stage, name, wall_time, peak_memory / 2**20))
+
+def run_benchmark(sizes, num_fields, repeat, budget):
+    env = generator.get_environment()
+    templates = sorted((TEMPLATE_DIR / "wishbone").glob("*.template"))
+
+    results = []
+    over_budget = set()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = pathlib.Path(tmp_dir)
+
+        for num_registers in sizes:
+            csv_filename = tmp_dir / "bench_reg.csv"
+            json_filename = tmp_dir / "bench_reg.json"
+
+            make_csv(csv_filename, num_registers, num_fields)
+
+            run_stage(results, over_budget, num_registers, "convert", "converter", converter.convert_file,
+                      (csv_filename, json_filename), repeat, budget)
+            run_stage(results, over_budget, num_registers, "load", "json", load_library, (json_filename,),
+                      repeat, budget)
+
+            data = load_library(json_filename)
+
+            for template_filename in templates:
+                template = env.get_template(str(template_filename.resolve()))
+                template_data = overview_data(data) if template_filename.name == "register_overview.template" else data
+                run_stage(results, over_budget, num_registers, "render", template_filename.name, render_template,
+                          (template, template_data), repeat, budget)
+
+    return results
+
+def compare_results(baseline, results, threshold, min_time):
+    # Match the runs by register count, stage and name
+    reference = {(result["registers"], result["stage"], result["name"]) : result for result in baseline["results"]}
+    regressions = 0
+
+    print("{:>8} {:<8} {:<32} {:>10} {:>10}".format("regs", "stage", "name", "time", "memory"))
+
+    for result in results:
+        key = (result["registers"], result["stage"], result["name"])
+
+        if key not in reference or result["wall_time"] is None or reference[key]["wall_time"] is None:
+            continue
+
+        time_ratio = result["wall_time"] / reference[key]["wall_time"]
+        memory_ratio = result["peak_memory"] / max(reference[key]["peak_memory"], 1)
+
+        # Very short runs are dominated by timer noise
+        slower = time_ratio > 1 + threshold and result["wall_time"] > min_time
+
+        status = ""
+        if slower or memory_ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions += 1
+
+        print("{:>8} {:<8} {:<32} {:>9.2f}x {:>9.2f}x {}".format(*key, time_ratio, memory_ratio, status))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark converter and generator on synthetic register maps.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 50000],
+                        help='number of registers of each register map')
+    parser.add_argument('-f', '--fields', type=int, default=2, choices=range(1, len(FIELDS) + 1),
+                        help='bit fields per register')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='timed runs per measurement, the fastest is reported')
+    parser.add_argument('-b', '--budget', type=float, default=5.0,
+                        help='seconds after which a stage is skipped for larger register maps')
+    parser.add_argument('-o', '--output', type=str, help='save the results as JSON')
+    parser.add_argument('-c', '--compare', type=generator.file_path, help='JSON results of a previous run to compare with')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1, help='relative slowdown reported as regression')
+    parser.add_argument('--min_time', type=float, default=0.01, help='seconds below which slowdowns are not reported')
+
+    args = parser.parse_args()
+
+    print("{:>8} {:<8} {:<32} {:>12} {:>12}".format("regs", "stage", "name", "time/s", "memory/MB"))
+
+    results = run_benchmark(sorted(args.sizes), args.fields, args.repeat, args.budget)
+
+    run = {"version" : RESULTS_VERSION,
+           "python" : platform.python_version(),
+           "jinja2" : jinja2.__version__,
+           "fields" : args.fields,
+           "repeat" : args.repeat,
+           "results" : results}
+
+    if args.output != None:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=4)
+        print("Results saved to {}".format(args.output))
+
+    if args.compare != None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+        if baseline.get("version") != RESULTS_VERSION or baseline.get("fields") != args.fields:
+            print("Error: {} was recorded with a different format or number of fields".format(args.compare))
+            sys.exit(1)
+
+        regressions = compare_results(baseline, results, args.threshold, args.min_time)
+
+        if regressions:
+            print("{} regressions above {:.0%}".format(regressions, args.threshold))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
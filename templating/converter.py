@@ -31,66 +31,98 @@ def file_path(string):
 
     return string
 
+def write_depfile(depfile, targets):
+    # The pattern rule already has the csv file, the converter itself is the missing prerequisite
+    pathlib.Path(depfile).parent.mkdir(parents=True, exist_ok=True)
+    converter = os.path.relpath(__file__)
+
+    with open(depfile, "w") as f:
+        for target in targets:
+            f.write("{}: {}\n".format(target, converter))
+
+        # Empty rule, so that moving the converter does not break make
+        f.write("\n{}:\n".format(converter))
+
+def convert_file(in_filename, out_filename, verbose=False):
+    in_filename = pathlib.Path(in_filename)
+
+    if in_filename.suffix != ".csv":
+        raise ValueError("Currently only .csv files can be converted")
+    
+    if verbose:
+        print("in_filename: {}".format(in_filename))
+        print("out_filename: {}".format(out_filename))
+    
+    json_dict = {"registers" : {}}
+
+    with open(in_filename, 'r') as f_csv:
+        csv_reader = csv.DictReader(f_csv)
+
+        last_register = None
+
+        for entry in csv_reader:
+            if verbose:
+                print("Current entry: {}".format(entry))
+            
+            # Register
+            if entry['RegName'] != '':
+                last_register = entry['RegName']
+                json_dict["registers"][entry['RegName']] = {"address" : entry['Address'],
+                                                            "description" : entry['Description'],
+                                                            "entries" : {}
+                                                            }
+            else:
+                json_dict["registers"][last_register]["entries"][entry['BitName']] = {"access" : entry['Access'],
+                                                                    "hardware" : entry['HW'],
+                                                                    "LSB" : entry['LSB'],
+                                                                    "MSB" : entry['MSB'],
+                                                                    "reset" : entry['Reset'],
+                                                                    "description": entry['Description']
+                                                                    }
+
+    if verbose:
+        print("Complete dictionary:")
+        print(json_dict)
+    
+    with open(out_filename, "w") as f_json:
+        json.dump(json_dict, f_json, indent=4, sort_keys=True)
+
+    return json_dict
+
+def convert(in_filenames, out_filenames, depfile=None, verbose=False):
+    # Library entry point, returns the dictionary of each converted file
+    in_filenames = [pathlib.Path(in_filename) for in_filename in in_filenames]
+    out_filenames = [pathlib.Path(out_filename) for out_filename in out_filenames]
+
+    if len(in_filenames) != len(out_filenames):
+        raise ValueError("The number of input and output files must be equal")
+
+    json_dicts = [convert_file(in_filename, out_filename, verbose)
+                  for (in_filename, out_filename) in zip(in_filenames, out_filenames)]
+
+    if depfile:
+        write_depfile(depfile, out_filenames)
+
+    return json_dicts
+
 def main():
     parser = argparse.ArgumentParser(description='Generate code blocks from templates inside files.')
     parser.add_argument('-i', '--input', type=file_path, nargs='+', required=True, help='input file')
     parser.add_argument('-o', '--output', type=str, nargs='+', help='output file, if not set equals input file')
+    parser.add_argument('-M', '--depfile', type=str, help='write make rules that make each output depend on the converter')
     parser.add_argument('-v', '--verbose', action='store_true', help='verbose output')
 
     args = parser.parse_args()
     
-    # Set file names
-    in_filenames = [pathlib.Path(input) for input in args.input]
-    out_filenames = [pathlib.Path(output) for output in args.output]
-    
-    if len(in_filenames) != len(out_filenames):
+    if len(args.input) != len(args.output):
         print('Error: The number of input and output files must be equal')
         sys.exit(0)
-    
-    for (file_cnt, in_filename) in enumerate(in_filenames):
-        out_filename = out_filenames[file_cnt]
-        
-        if in_filename.suffix != ".csv":
-            print("Currently only .csv files can be converted")
-            sys.exit(0)
-        
-        if args.verbose:
-            print("in_filename: {}".format(in_filename))
-            print("out_filename: {}".format(out_filename))
-        
-        json_dict = {"registers" : {}}
-
-        with open(in_filename, 'r') as f_csv:
-            csv_reader = csv.DictReader(f_csv)
-
-            last_register = None
-
-            for entry in csv_reader:
-                if args.verbose:
-                    print("Current entry: {}".format(entry))
-                
-                # Register
-                if entry['RegName'] != '':
-                    last_register = entry['RegName']
-                    json_dict["registers"][entry['RegName']] = {"address" : entry['Address'],
-                                                                "description" : entry['Description'],
-                                                                "entries" : {}
-                                                                }
-                else:
-                    json_dict["registers"][last_register]["entries"][entry['BitName']] = {"access" : entry['Access'],
-                                                                        "hardware" : entry['HW'],
-                                                                        "LSB" : entry['LSB'],
-                                                                        "MSB" : entry['MSB'],
-                                                                        "reset" : entry['Reset'],
-                                                                        "description": entry['Description']
-                                                                        }
-
-        if args.verbose:
-            print("Complete dictionary:")
-            print(json_dict)
-        
-        with open(out_filename, "w") as f_json:
-            json.dump(json_dict, f_json, indent=4, sort_keys=True)
+
+    try:
+        convert(args.input, args.output, args.depfile, args.verbose)
+    except ValueError as error:
+        print(error)
+        sys.exit(0)
 
     print("Library conversion done.")
 
@@ -2,12 +2,33 @@
 # SPDX-FileCopyrightText: © 2022 semify <office@semify-eda.com>
 # SPDX-License-Identifier: Apache-2.0
 
+import io
+import os
 import sys
 import csv
 import json
+import shutil
+import filecmp
+import hashlib
 import argparse
 import pathlib
-from jinja2 import Environment, FileSystemLoader
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+import converter
+
+MANIFEST_VERSION = 1
+
+# State of a worker process when rendering in parallel
+worker_env = None
+worker_manifest = None
+
+# Process-wide caches, an entry is valid as long as the file is not modified
+shared_env = None
+library_cache = {}
+hash_cache = {}
 
 def dir_path(string):
     path = pathlib.Path(string)
@@ -31,12 +52,491 @@ def file_path(string):
 
     return string
 
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.sha256(content).hexdigest()
+
+def file_hash(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def cached_file_hash(path):
+    key = manifest_key(path)
+    signature = file_signature(path)
+
+    cached = hash_cache.get(key)
+    if cached is None or cached[0] != signature:
+        cached = (signature, file_hash(path))
+        hash_cache[key] = cached
+
+    return cached[1]
+
+def load_library(path):
+    # Parse each data library only once, even if it is used by many blocks
+    key = manifest_key(path)
+    signature = file_signature(path)
+
+    cached = library_cache.get(key)
+    if cached is None or cached[0] != signature:
+        with open(path, "rb") as f_json:
+            data_content = f_json.read()
+        cached = (signature, json.loads(data_content), content_hash(data_content))
+        library_cache[key] = cached
+
+    return (cached[1], cached[2])
+
+def manifest_key(path):
+    return str(pathlib.Path(path).resolve())
+
+def load_manifest(path):
+    manifest = None
+
+    if path.is_file():
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+        except json.JSONDecodeError:
+            print("Warning: Ignoring corrupt manifest {}".format(path))
+
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version" : MANIFEST_VERSION, "files" : {}, "blocks" : {}}
+
+    return manifest
+
+def save_manifest(path, manifest):
+    # Drop rendered blocks that are no longer used by any file
+    used_blocks = set()
+    for entry in manifest["files"].values():
+        used_blocks.update(entry["blocks"])
+
+    manifest["blocks"] = {key : block for (key, block) in manifest["blocks"].items() if key in used_blocks}
+
+    # Replace the manifest atomically, parallel make jobs may share it
+    tmp_fd, tmp_name = tempfile.mkstemp(prefix=".{}.".format(path.name), dir=path.parent)
+    with os.fdopen(tmp_fd, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+    replace_file(pathlib.Path(tmp_name), path)
+
+def make_escape(path):
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+def write_depfile(depfile, rules):
+    pathlib.Path(depfile).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(depfile, "w") as f:
+        for (target, prerequisites) in rules:
+            f.write("{}:".format(make_escape(target)))
+            for prerequisite in prerequisites:
+                f.write(" \\\n {}".format(make_escape(prerequisite)))
+            f.write("\n")
+
+        # Empty rules for data and template files, so that removing one does not break make
+        empty_rules = []
+        for (target, prerequisites) in rules:
+            for prerequisite in prerequisites[1:]:
+                if prerequisite not in empty_rules:
+                    empty_rules.append(prerequisite)
+
+        for prerequisite in empty_rules:
+            f.write("\n{}:\n".format(make_escape(prerequisite)))
+
+def is_up_to_date(entry, in_filename, out_filename):
+    # Check the hashes of the input, the output and every data and template file
+    if entry is None or entry["input"] != manifest_key(in_filename):
+        return False
+
+    if not out_filename.is_file():
+        return False
+
+    try:
+        if file_hash(in_filename) != entry["input_hash"]:
+            return False
+        if file_hash(out_filename) != entry["output_hash"]:
+            return False
+        for (dependency, dependency_hash) in entry["dependencies"].items():
+            if file_hash(dependency) != dependency_hash:
+                return False
+    except FileNotFoundError:
+        return False
+
+    return True
+
+def get_environment(cache_dir=None):
+    global shared_env
+
+    # One environment per process, compiled templates are kept in memory and on disk
+    if shared_env is None:
+        if cache_dir == None:
+            bytecode_cache = FileSystemBytecodeCache()
+        else:
+            pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+
+        # Jinja file loader
+        file_loader = FileSystemLoader(searchpath='/')
+        shared_env = Environment(loader=file_loader, bytecode_cache=bytecode_cache)
+
+    return shared_env
+
+def render_markers(env, in_filename, input_lines, data_dir=None, template_dir=None, verbose=False, block_cache=None,
+                   dependencies=None, blocks=None, rendered_blocks=None, log=sys.stdout):
+    # Stream the input line by line and yield the output in chunks
+    read_data = False
+    read_template = False
+    read_code = False
+    
+    data = None
+    data_hash = None
+    template = None
+    template_hash = None
+
+    code_line = None
+
+    for line in input_lines:
+    
+        if read_code:
+            if "marker_template_end" in line:
+                read_code = False
+                
+                whitespace = line[:len(line) - len(line.lstrip())]
+                
+                # Reuse the block if data and template are unchanged
+                block_key = "{}:{}".format(data_hash, template_hash)
+
+                if block_cache is not None and block_key in block_cache:
+                    generated_content = block_cache[block_key]
+                else:
+                    # Insert generated content
+                    generated_content = template.render(data)
+
+                    if rendered_blocks is not None:
+                        rendered_blocks[block_key] = generated_content
+
+                    if block_cache is not None:
+                        block_cache[block_key] = generated_content
+
+                if blocks is not None:
+                    blocks.append(block_key)
+                
+                if verbose:
+                    print(generated_content, file=log)
+                
+                yield code_line
+                yield whitespace + generated_content.replace("\n", "\n" + whitespace) + "\n"
+                yield line
+            continue
+    
+        if read_data:
+            if data_dir:
+                datapath = data_dir / line.strip().split("data:")[1].strip()
+            else:
+                datapath = in_filename.parent / line.strip().split("data:")[1].strip()
+            
+            if not datapath.exists():
+                print('Error: Data file {} does not exist'.format(datapath), file=log)
+            
+            if datapath.suffix == ".json":
+                (data, data_hash) = load_library(datapath)
+
+                if dependencies is not None:
+                    dependencies[manifest_key(datapath)] = data_hash
+            else:
+                sys.exit("Datatype not supported: " + datapath)
+            
+            yield line
+            read_data = False
+            read_template = True
+            continue
+            
+        if read_template:
+            if template_dir:
+                templatepath = template_dir / line.strip().split("template:")[1].strip()
+            else:
+                templatepath = in_filename.parent / line.strip().split("template:")[1].strip()
+            
+            if not templatepath.exists():
+                print('Error: Template file {} does not exist'.format(templatepath), file=log)
+            
+            template = env.get_template(str(templatepath.resolve()))
+            template_hash = cached_file_hash(templatepath)
+
+            if dependencies is not None:
+                dependencies[manifest_key(templatepath)] = template_hash
+
+            yield line
+            read_template = False
+            continue
+
+        # Most lines are hand written code
+        if "marker_template_" not in line:
+            yield line
+            continue
+        
+        if "marker_template_start" in line:
+            yield line
+            read_data = True
+            continue
+            
+        if "marker_template_code" in line:
+            # Hold back the marker until the block is complete
+            code_line = line
+            read_code = True
+            continue
+
+        yield line
+
+    # An unterminated block swallows the rest of the file including the last line break
+    if read_code:
+        yield code_line[:-1] if code_line.endswith("\n") else code_line
+
+def replace_file(tmp_filename, out_filename):
+    # Keep the permissions of the file we replace, or use the default ones for new files
+    if out_filename.is_file():
+        shutil.copymode(out_filename, tmp_filename)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+
+    os.replace(tmp_filename, out_filename)
+
+def generate_file(env, in_filename, out_filename, data_dir=None, template_dir=None, verbose=False, block_cache=None, log=sys.stdout):
+    dependencies = {}
+    blocks = []
+    rendered_blocks = {}
+
+    # Render into a temporary file next to the output, so the output is only replaced if it changed
+    tmp_fd, tmp_name = tempfile.mkstemp(prefix=".{}.".format(out_filename.name), dir=out_filename.parent)
+    tmp_filename = pathlib.Path(tmp_name)
+
+    try:
+        with open(in_filename, "r") as input_file, os.fdopen(tmp_fd, "w") as output_file:
+            output_file.writelines(render_markers(env, in_filename, input_file, data_dir, template_dir, verbose,
+                                                  block_cache, dependencies, blocks, rendered_blocks, log))
+
+        if verbose:
+            with open(tmp_filename, "r") as output_file:
+                shutil.copyfileobj(output_file, log)
+
+        if out_filename.is_file() and filecmp.cmp(tmp_filename, out_filename, shallow=False):
+            print("Generated file is the same as the output file at {}.".format(out_filename), file=log)
+        else:
+            print("Writing to file {}".format(out_filename), file=log)
+            replace_file(tmp_filename, out_filename)
+    finally:
+        tmp_filename.unlink(missing_ok=True)
+
+    entry = {"input" : manifest_key(in_filename),
+             "dependencies" : dependencies,
+             "blocks" : blocks
+             }
+
+    if block_cache is not None:
+        entry["input_hash"] = file_hash(in_filename)
+        entry["output_hash"] = file_hash(out_filename)
+
+    return (entry, rendered_blocks)
+
+def process_file(env, manifest, in_filename, out_filename, data_dir=None, template_dir=None, verbose=False):
+    # Collect the report of each file so that parallel runs print in order
+    log = io.StringIO()
+
+    # Skip the whole file if none of its inputs changed
+    if manifest is not None and not verbose:
+        entry = manifest["files"].get(manifest_key(out_filename))
+        if is_up_to_date(entry, in_filename, out_filename):
+            print("Inputs unchanged, skipping {}.".format(out_filename), file=log)
+            return (log.getvalue(), entry, {})
+
+    block_cache = None if manifest is None else manifest["blocks"]
+    (entry, rendered_blocks) = generate_file(env, in_filename, out_filename, data_dir, template_dir, verbose, block_cache, log)
+
+    return (log.getvalue(), entry, rendered_blocks)
+
+def init_worker(manifest, cache_dir):
+    global worker_env, worker_manifest
+
+    worker_env = get_environment(cache_dir)
+    worker_manifest = manifest
+
+def process_file_worker(in_filename, out_filename, data_dir, template_dir, verbose):
+    return process_file(worker_env, worker_manifest, in_filename, out_filename, data_dir, template_dir, verbose)
+
+def to_path(path):
+    return None if path is None else pathlib.Path(path)
+
+def generate(in_filenames, out_filenames=None, data_dir=None, template_dir=None, manifest=None, cache_dir=None, jobs=1,
+             verbose=False):
+    # Library entry point, returns the manifest entry of each output file
+    in_filenames = [pathlib.Path(in_filename) for in_filename in in_filenames]
+
+    if out_filenames is None:
+        out_filenames = in_filenames
+    else:
+        out_filenames = [pathlib.Path(out_filename) for out_filename in out_filenames]
+
+    if len(in_filenames) != len(out_filenames):
+        raise ValueError("The number of input and output files must be equal")
+
+    data_dir = to_path(data_dir)
+    template_dir = to_path(template_dir)
+
+    manifest_filename = to_path(manifest)
+    manifest = None if manifest_filename is None else load_manifest(manifest_filename)
+
+    num_files = len(in_filenames)
+
+    jobs = jobs if jobs > 0 else os.cpu_count()
+    jobs = min(jobs, num_files)
+
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(manifest, cache_dir))
+        results = executor.map(process_file_worker, in_filenames, out_filenames,
+                               [data_dir] * num_files, [template_dir] * num_files, [verbose] * num_files)
+    else:
+        executor = None
+        env = get_environment(cache_dir)
+        results = (process_file(env, manifest, in_filename, out_filename, data_dir, template_dir, verbose)
+                   for (in_filename, out_filename) in zip(in_filenames, out_filenames))
+
+    entries = []
+
+    # Results arrive in the order of the input files
+    for (out_filename, (report, entry, rendered_blocks)) in zip(out_filenames, results):
+        print(report, end='')
+        entries.append(entry)
+
+        if manifest is not None:
+            manifest["files"][manifest_key(out_filename)] = entry
+            manifest["blocks"].update(rendered_blocks)
+
+    if executor is not None:
+        executor.shutdown()
+
+    if manifest is not None:
+        save_manifest(manifest_filename, manifest)
+
+    print("Template generation done.")
+
+    return entries
+
+def dependency_rules(in_filenames, out_filenames, entries, dep_target=None):
+    rules = []
+
+    for (in_filename, out_filename, entry) in zip(in_filenames, out_filenames, entries):
+        target = str(out_filename) if dep_target == None else dep_target
+        prerequisites = [str(in_filename)] + [os.path.relpath(dependency) for dependency in entry["dependencies"]]
+        rules.append((target, prerequisites))
+
+    return rules
+
+def watched_files(in_filenames, entries):
+    # Map each watched file to the indices of the outputs using it
+    users = {}
+
+    for (file_cnt, (in_filename, entry)) in enumerate(zip(in_filenames, entries)):
+        for path in [manifest_key(in_filename)] + list(entry["dependencies"]):
+            users.setdefault(path, set()).add(file_cnt)
+
+            # Libraries are converted from a CSV file with the same name
+            csv_path = pathlib.Path(path).with_suffix(".csv")
+            if path.endswith(".json") and csv_path.is_file():
+                users.setdefault(str(csv_path), set()).add(file_cnt)
+
+    return users
+
+def snapshot(paths):
+    signatures = {}
+
+    for path in paths:
+        try:
+            signatures[path] = file_signature(path)
+        except FileNotFoundError:
+            signatures[path] = None
+
+    return signatures
+
+def watch(in_filenames, out_filenames=None, data_dir=None, template_dir=None, manifest=None, cache_dir=None,
+          depfile=None, interval=1.0, verbose=False):
+    # Render in this process so the environment and the libraries stay loaded between changes
+    in_filenames = [pathlib.Path(in_filename) for in_filename in in_filenames]
+    out_filenames = in_filenames if out_filenames is None else [pathlib.Path(output) for output in out_filenames]
+
+    entries = generate(in_filenames, out_filenames, data_dir, template_dir, manifest, cache_dir, 1, verbose)
+
+    if depfile != None:
+        write_depfile(depfile, dependency_rules(in_filenames, out_filenames, entries))
+
+    users = watched_files(in_filenames, entries)
+    signatures = snapshot(users)
+
+    print("Watching {} files, press Ctrl+C to stop.".format(len(users)))
+
+    try:
+        while True:
+            time.sleep(interval)
+
+            current = snapshot(users)
+            changed = [path for path in users if current[path] != signatures[path]]
+
+            if not changed:
+                continue
+
+            for path in changed:
+                print("Changed: {}".format(os.path.relpath(path)))
+
+            # Convert changed libraries first, the generator reads the JSON files
+            for path in changed:
+                if path.endswith(".csv") and current[path] is not None:
+                    converter.convert([path], [pathlib.Path(path).with_suffix(".json")], verbose=verbose)
+
+            affected = sorted(set().union(*(users[path] for path in changed)))
+
+            try:
+                new_entries = generate([in_filenames[file_cnt] for file_cnt in affected],
+                                       [out_filenames[file_cnt] for file_cnt in affected],
+                                       data_dir, template_dir, manifest, cache_dir, 1, verbose)
+            except Exception as error:
+                # Keep watching, the next change may fix the input
+                print("Error: {}".format(error))
+                new_entries = None
+
+            if new_entries is not None:
+                for (file_cnt, entry) in zip(affected, new_entries):
+                    entries[file_cnt] = entry
+
+                if depfile != None:
+                    write_depfile(depfile, dependency_rules(in_filenames, out_filenames, entries))
+
+            # Our own writes and new dependencies must not trigger another round
+            users = watched_files(in_filenames, entries)
+            signatures = snapshot(users)
+
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
 def main():
     parser = argparse.ArgumentParser(description='Generate code blocks from templates inside files.')
     parser.add_argument('-i', '--input', type=file_path, nargs='+', required=True, help='input file')
     parser.add_argument('-o', '--output', type=str, nargs='+', help='output file, if not set equals input file')
     parser.add_argument('-d', '--data_dir', type=dir_path,  help='base data directory')
     parser.add_argument('-t', '--template_dir', type=dir_path,  help='base template directory')
+    parser.add_argument('-m', '--manifest', type=str, help='manifest file, enables incremental generation')
+    parser.add_argument('-c', '--cache_dir', type=str, help='directory of the compiled template cache')
+    parser.add_argument('-M', '--depfile', type=str, nargs='+', help='write make rules with the data and template files of each output, to one file or one per output')
+    parser.add_argument('--dep_target', type=str, nargs='+', help='target name used in the depfile, one per depfile')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of files rendered in parallel, 0 uses all CPUs')
+    parser.add_argument('-w', '--watch', action='store_true', help='keep running and regenerate the outputs of changed files')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between checks for changes in watch mode')
     parser.add_argument('-v', '--verbose', action='store_true', help='print generated code')
 
     args = parser.parse_args()
@@ -48,123 +548,34 @@ def main():
         out_filenames = in_filenames
     else:
         out_filenames = [pathlib.Path(output) for output in args.output]
-    
-    if args.data_dir == None:
-        data_dir = None
-    else:
-        data_dir = pathlib.Path(args.data_dir)
 
-    if args.template_dir == None:
-        template_dir = None
-    else:
-        template_dir = pathlib.Path(args.template_dir)
-        
-    # Jinja file loader
-    file_loader = FileSystemLoader(searchpath='/')
-    env = Environment(loader=file_loader)
-    
-    for (file_cnt, in_filename) in enumerate(in_filenames):
-    
-        out_filename = out_filenames[file_cnt]
-    
-        input_file_content = ""
-        output_file_content = ""
-        
-        with open(in_filename, "r") as input_file:
-            input_file_content = input_file.read()
+    if len(in_filenames) != len(out_filenames):
+        parser.error('the number of input and output files must be equal')
 
-        read_data = False
-        read_template = False
-        read_code = False
-        
-        data = None
-        template = None
-        
-        for line in input_file_content.split('\n'):
-        
-            if read_code:
-                if "marker_template_end" in line:
-                    read_code = False
-                    
-                    whitespace = line[:len(line) - len(line.lstrip())]
-                    
-                    # Insert generated content
-                    generated_content = template.render(data)
-                    
-                    if args.verbose:
-                        print(generated_content)
-                    
-                    for generated_line in generated_content.split('\n'):
-                        output_file_content += whitespace + generated_line + "\n"
-     
-                    output_file_content += line + "\n"
-                continue
-        
-            if read_data:
-                if data_dir:
-                    datapath = data_dir / line.strip().split("data:")[1].strip()
-                else:
-                    datapath = in_filename.parent / line.strip().split("data:")[1].strip()
-                
-                if not datapath.exists():
-                    print('Error: Data file {} does not exist'.format(datapath))
-                
-                if datapath.suffix == ".json":
-                    with open(datapath, "r") as f_json:
-                        data = json.load(f_json)
-                else:
-                    sys.exit("Datatype not supported: " + datapath)
-                
-                output_file_content += line + "\n"
-                read_data = False
-                read_template = True
-                continue
-                
-            if read_template:
-                if template_dir:
-                    templatepath = template_dir / line.strip().split("template:")[1].strip()
-                else:
-                    templatepath = in_filename.parent / line.strip().split("template:")[1].strip()
-                
-                if not templatepath.exists():
-                    print('Error: Template file {} does not exist'.format(templatepath))
-                
-                template = env.get_template(str(templatepath.resolve()))
-                output_file_content += line + "\n"
-                read_template = False
-                continue
-            
-            if "marker_template_start" in line:
-                output_file_content += line + "\n"
-                read_data = True
-                continue
-                
-            if "marker_template_code" in line:
-                output_file_content += line + "\n"
-                read_code = True
-                continue
+    if args.depfile != None and len(args.depfile) not in (1, len(in_filenames)):
+        parser.error('--depfile takes a single file or one per input file')
 
-            output_file_content += line + "\n"
+    if args.dep_target != None and (args.depfile == None or len(args.dep_target) != len(args.depfile) or len(in_filenames) != len(args.depfile)):
+        parser.error('--dep_target needs one depfile per input file and one target per depfile')
 
-        # Remove last \n
-        output_file_content = output_file_content[:-1]
+    if args.watch:
+        if args.dep_target != None or (args.depfile != None and len(args.depfile) != 1):
+            parser.error('--watch only writes a single depfile without --dep_target')
 
-        if args.verbose:
-            print(output_file_content, end='')
-        
-        original_output_file_content = None
-        if out_filename.is_file():
-            with open(out_filename, "r") as output_file:
-                original_output_file_content = output_file.read()
-        
-        if output_file_content == original_output_file_content:
-            print("Generated file is the same as the output file at {}.".format(out_filename))
-        else:
-            print("Writing to file {}".format(out_filename))
-            with open(out_filename, "w") as output_file:
-                output_file.write(output_file_content)
-                
-    print("Template generation done.")
+        watch(in_filenames, out_filenames, args.data_dir, args.template_dir, args.manifest, args.cache_dir,
+              args.depfile[0] if args.depfile != None else None, args.interval, args.verbose)
+        return
+
+    entries = generate(in_filenames, out_filenames, args.data_dir, args.template_dir, args.manifest, args.cache_dir,
+                       args.jobs, args.verbose)
+
+    if args.depfile != None and len(args.depfile) == 1 and args.dep_target == None:
+        write_depfile(args.depfile[0], dependency_rules(in_filenames, out_filenames, entries))
+    elif args.depfile != None:
+        # One depfile per output, so make can regenerate any subset of the files in a single call
+        dep_targets = args.dep_target if args.dep_target != None else [None] * len(args.depfile)
+        for (depfile, dep_target, in_filename, out_filename, entry) in zip(args.depfile, dep_targets, in_filenames, out_filenames, entries):
+            write_depfile(depfile, dependency_rules([in_filename], [out_filename], [entry], dep_target))
 
 if __name__ == "__main__":
     main()